@@ -5,6 +5,9 @@ import sys
 
 
 def main():
+    #tests run on in-memory SQLite unless settings are given explicitly
+    if len(sys.argv) > 1 and sys.argv[1] == 'test':
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'officialTutorial.test_settings')
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'officialTutorial.settings')
     try:
         from django.core.management import execute_from_command_line
@@ -0,0 +1,7 @@
+"""PostgreSQL backend with connection pool and health checks, see officialTutorial.db.pool"""
+from django.db.backends.postgresql import base
+
+from officialTutorial.db.pool import PooledDatabaseWrapperMixin
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    pass
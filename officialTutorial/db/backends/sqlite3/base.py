@@ -0,0 +1,7 @@
+"""SQLite backend with connection pool and health checks, see officialTutorial.db.pool"""
+from django.db.backends.sqlite3 import base
+
+from officialTutorial.db.pool import PooledDatabaseWrapperMixin
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    pass
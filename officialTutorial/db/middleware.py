@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.signals import request_finished
+
+from .routers import allow_replica_reads
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+def _reset_replica_reads(**kwargs):
+    allow_replica_reads(False)
+
+#streaming responses are read after middleware returns,
+#so replica reads are turned off when response is closed
+request_finished.connect(_reset_replica_reads)
+
+class ReplicaPinMiddleware:
+    """
+    Allows replica reads for safe requests. Successful unsafe request
+    (vote, comment, admin edit) sets a cookie that keeps the client on
+    primary for REPLICA_PIN_SECONDS, so it reads its own writes
+    even if replicas lag behind.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        cookie = settings.REPLICA_PIN_COOKIE
+        safe = request.method in SAFE_METHODS
+        allow_replica_reads(safe and cookie not in request.COOKIES)
+        response = self.get_response(request)
+        if not safe and response.status_code < 400:
+            response.set_cookie(cookie, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True)
+        return response
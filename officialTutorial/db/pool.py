@@ -0,0 +1,249 @@
+"""
+In-process database connection pool
+
+Django opens one connection per thread and closes it at the end of request
+(or after CONN_MAX_AGE). Backends in officialTutorial.db.backends take
+connections from ConnectionPool instead when database settings have 'POOL',
+so closing connection returns it to the pool and the next request skips
+TCP and authentication handshake.
+
+    DATABASES = {'default': {
+        'ENGINE': 'officialTutorial.db.backends.postgresql',
+        ...
+        'POOL': {'SIZE': 5, 'MAX_OVERFLOW': 10, 'TIMEOUT': 30},
+    }}
+"""
+import collections
+import threading
+import time
+
+from django.db.utils import OperationalError
+
+POOL_DEFAULTS = {
+    #connections kept open while idle
+    'SIZE': 5,
+    #connections opened on top of SIZE under load, closed once returned
+    'MAX_OVERFLOW': 10,
+    #seconds to wait for free connection before PoolTimeout
+    'TIMEOUT': 30,
+    #seconds after which connection is replaced, None to keep forever
+    'RECYCLE': 3600,
+    #connections idle for longer are checked with a query before reuse
+    'PING_AFTER': 30,
+}
+
+class PoolTimeout(OperationalError):
+    pass
+
+class ConnectionPool:
+    """
+    Thread safe pool of DB-API connections
+    connect() opens new connection, ping(connection) raises if it's broken
+    """
+    def __init__(self, connect, ping, size=5, max_overflow=10, timeout=30, recycle=3600, ping_after=30):
+        self._connect = connect
+        self._ping = ping
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+        self._condition = threading.Condition()
+        #(connection, opened at, returned at), most recently returned last
+        self._idle = collections.deque()
+        #id(connection) -> opened at
+        self._in_use = {}
+        self._opened = 0
+        self._counters = collections.Counter()
+
+    def checkout(self):
+        """Returns idle connection, opens new one or waits until one is returned"""
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        with self._condition:
+            while True:
+                if self._idle:
+                    idle = self._idle.pop()
+                    break
+                if self._opened < self.size + self.max_overflow:
+                    #reserve a slot, connection is opened outside of lock
+                    self._opened += 1
+                    idle = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters['timeouts'] += 1
+                    raise PoolTimeout(
+                        "No free database connection after {} seconds".format(self.timeout))
+                if not waited:
+                    self._counters['waits'] += 1
+                    waited = True
+                self._condition.wait(remaining)
+            self._counters['checkouts'] += 1
+
+        if idle is not None:
+            connection, opened_at, returned_at = idle
+            if self._is_healthy(connection, opened_at, returned_at):
+                with self._condition:
+                    self._in_use[id(connection)] = opened_at
+                return connection
+            self._close(connection)
+            with self._condition:
+                self._counters['discarded'] += 1
+        try:
+            connection = self._connect()
+        except Exception:
+            with self._condition:
+                self._opened -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._counters['opened'] += 1
+            self._in_use[id(connection)] = time.monotonic()
+        return connection
+
+    def checkin(self, connection, discard=False):
+        """Returns connection to pool, rolling back unfinished transaction"""
+        if not discard:
+            try:
+                connection.rollback()
+            except Exception:
+                discard = True
+        with self._condition:
+            opened_at = self._in_use.pop(id(connection), time.monotonic())
+            keep = not discard and len(self._idle) < self.size
+            if keep:
+                self._idle.append((connection, opened_at, time.monotonic()))
+            else:
+                self._opened -= 1
+                if discard:
+                    self._counters['discarded'] += 1
+            self._condition.notify()
+        if not keep:
+            self._close(connection)
+
+    def close_all(self):
+        """Closes idle connections, connections in use are closed when returned"""
+        with self._condition:
+            idle, self._idle = self._idle, collections.deque()
+            self._opened -= len(idle)
+        for connection, _, _ in idle:
+            self._close(connection)
+
+    def stats(self):
+        with self._condition:
+            return {
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'opened': self._opened,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'checkouts': self._counters['checkouts'],
+                'waits': self._counters['waits'],
+                'timeouts': self._counters['timeouts'],
+                'connections_opened': self._counters['opened'],
+                'discarded': self._counters['discarded'],
+            }
+
+    def _is_healthy(self, connection, opened_at, returned_at):
+        now = time.monotonic()
+        if self.recycle is not None and now - opened_at > self.recycle:
+            return False
+        if self.ping_after is not None and now - returned_at > self.ping_after:
+            try:
+                self._ping(connection)
+            except Exception:
+                return False
+        return True
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(alias, connect, ping, options):
+    """Returns process-wide pool of database alias, creating it on first call"""
+    with _pools_lock:
+        if alias not in _pools:
+            options = {**POOL_DEFAULTS, **options}
+            _pools[alias] = ConnectionPool(
+                connect, ping,
+                size=options['SIZE'],
+                max_overflow=options['MAX_OVERFLOW'],
+                timeout=options['TIMEOUT'],
+                recycle=options['RECYCLE'],
+                ping_after=options['PING_AFTER'],
+            )
+        return _pools[alias]
+
+def pool_stats():
+    """Returns {alias: stats} of pools opened in this process"""
+    with _pools_lock:
+        pools = dict(_pools)
+    return {alias: pool.stats() for alias, pool in pools.items()}
+
+def _ping(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute('SELECT 1')
+    finally:
+        cursor.close()
+
+class PooledDatabaseWrapperMixin:
+    """
+    Mixin for backend DatabaseWrapper
+    With 'POOL' in database settings connections come from ConnectionPool.
+    With 'HEALTH_CHECKS' persistent connection (CONN_MAX_AGE) is checked
+    once per request before first query, so broken connection left
+    by database restart doesn't fail the request.
+    """
+    health_check_done = False
+
+    def _pool(self):
+        options = self.settings_dict.get('POOL')
+        if not options:
+            return None
+        connect = super().get_new_connection
+        return get_pool(self.alias, lambda: connect(self.get_connection_params()), _ping, options)
+
+    def get_new_connection(self, conn_params):
+        #fresh or pool checked connection doesn't need health check
+        self.health_check_done = True
+        pool = self._pool()
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        return pool.checkout()
+
+    def _close(self):
+        pool = self._pool()
+        if pool is None or self.connection is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            pool.checkin(self.connection, discard=self.errors_occurred and not self._is_alive())
+
+    def _is_alive(self):
+        try:
+            _ping(self.connection)
+        except Exception:
+            return False
+        return True
+
+    def close_if_unusable_or_obsolete(self):
+        #called at start and end of every request
+        self.health_check_done = False
+        super().close_if_unusable_or_obsolete()
+
+    def ensure_connection(self):
+        if (self.connection is not None and not self.health_check_done
+                and not self.in_atomic_block and self.settings_dict.get('HEALTH_CHECKS')):
+            self.health_check_done = True
+            if not self._is_alive():
+                #broken connection can't be returned to pool
+                self.errors_occurred = True
+                self.close()
+        super().ensure_connection()
@@ -0,0 +1,50 @@
+"""
+Read replica routing
+
+Reads of polls models go to one of DATABASE_REPLICAS, but only while
+ReplicaPinMiddleware allows it for the current thread: during GET/HEAD
+requests of clients that didn't write recently. The replica is picked once
+per request, so question, choices and comments (and ETags and fragments
+built from them) come from one replica, not from replicas lagging differently. Writes, POST requests,
+clients pinned by cookie after a write, management commands and
+background threads all use the primary ('default').
+"""
+import random
+import threading
+
+from django.conf import settings
+
+_state = threading.local()
+
+def allow_replica_reads(allowed):
+    """Lets current thread read from one randomly picked replica (or stops it)"""
+    replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+    _state.replica = random.choice(replicas) if allowed and replicas else None
+
+def current_replica():
+    """Returns replica alias current thread reads from or None"""
+    return getattr(_state, 'replica', None)
+
+def replica_reads_allowed():
+    return current_replica() is not None
+
+class ReplicaRouter:
+    #apps whose reads may be served by replicas
+    replica_apps = {'polls'}
+
+    def db_for_read(self, model, **hints):
+        replica = current_replica()
+        if replica is not None and model._meta.app_label in self.replica_apps:
+            return replica
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        #replicas hold the same data as primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        #replicas get schema through replication
+        return db not in getattr(settings, 'DATABASE_REPLICAS', [])
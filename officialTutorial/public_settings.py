@@ -0,0 +1,46 @@
+"""
+Lean settings for workers that only serve poll pages
+
+    DJANGO_SETTINGS_MODULE=officialTutorial.public_settings gunicorn officialTutorial.wsgi
+
+With POLLS_LIVE_RESULTS=1 add --worker-class gthread --threads N (or gevent),
+every results stream holds a worker thread.
+
+No admin, auth, sessions or messages: polls pages don't use them, and
+skipping their apps, middleware and context processors cuts worker start
+time and per-request work. Admin and management commands use the full
+officialTutorial.settings. Compare both with "manage.py benchmark_startup".
+"""
+from .settings import *  # noqa: F401,F403
+
+INSTALLED_APPS = [
+    'polls.apps.PollsConfig',
+]
+
+MIDDLEWARE = [
+    'polls.middleware.RequestMetricsMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'officialTutorial.db.middleware.ReplicaPinMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+ROOT_URLCONF = 'officialTutorial.public_urls'
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [os.path.join(BASE_DIR, 'templates')],  # noqa: F405
+        'OPTIONS': {
+            #public workers serve production traffic, templates are always parsed once
+            'loaders': [('django.template.loaders.cached.Loader', [
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ])],
+            'context_processors': [
+                'django.template.context_processors.request',
+            ],
+        },
+    },
+]
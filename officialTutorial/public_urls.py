@@ -0,0 +1,6 @@
+"""URLs of officialTutorial.public_settings workers, polls without admin"""
+from django.urls import include, path
+
+urlpatterns = [
+    path('polls/', include('polls.urls')),
+]
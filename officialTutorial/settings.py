@@ -41,7 +41,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    #first, so it measures all other middleware too
+    'polls.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'officialTutorial.db.middleware.ReplicaPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -52,12 +55,22 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'officialTutorial.urls'
 
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+#templates are parsed once per process and kept in memory,
+#DEBUG alone re-reads them on every request so edits show up right away
+#DJANGO_TEMPLATE_CACHE=1 turns cached loader on with DEBUG too
+if not DEBUG or os.environ.get('DJANGO_TEMPLATE_CACHE') == '1':
+    TEMPLATE_LOADERS = [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': TEMPLATE_LOADERS,
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -76,15 +89,70 @@ WSGI_APPLICATION = 'officialTutorial.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'testdb',
-        'USER': 'testuser',
-        #NOTE TESTS DOESNT WORK IF USER DOESNT HAVE PERMISSION TO CREATE DB
+        #django.db.backends.postgresql with connection pool and health checks
+        'ENGINE': 'officialTutorial.db.backends.postgresql',
+        'NAME': os.environ.get('DB_NAME', 'testdb'),
+        'USER': os.environ.get('DB_USER', 'testuser'),
         #NOTE DOESNT WORK ON USERS WHO HAVE NO PASSWORD
-        'PASSWORD': 'testPassword',
-        'HOST': 'localhost',
-        'PORT': '5432',
+        #NOTE "manage.py test" uses in-memory SQLite (test_settings.py), running
+        #tests with these settings needs USER with permission to create DB
+        'PASSWORD': os.environ.get('DB_PASSWORD', 'testPassword'),
+        'HOST': os.environ.get('DB_HOST', 'localhost'),
+        'PORT': os.environ.get('DB_PORT', '5432'),
+        #keep connection open between requests of the same thread
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+        #check reused connection once per request before first query
+        'HEALTH_CHECKS': True,
+    }
+}
+
+#in-process pool shared by all threads, see officialTutorial/db/pool.py
+#NOTE: with pool DB_CONN_MAX_AGE is ignored, connections go back to pool
+#after every request instead of staying with their thread
+if os.environ.get('DB_POOL_SIZE'):
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['POOL'] = {
+        'SIZE': int(os.environ['DB_POOL_SIZE']),
+        'MAX_OVERFLOW': int(os.environ.get('DB_POOL_MAX_OVERFLOW', '10')),
+        'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', '30')),
     }
+
+#read replicas, comma separated hosts with the same credentials as primary
+#polls reads of GET requests are spread over them, see officialTutorial/db/routers.py
+DATABASE_REPLICAS = []
+for number, host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(','))):
+    alias = 'replica{}'.format(number + 1)
+    DATABASES[alias] = dict(DATABASES['default'], HOST=host.strip(), TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['officialTutorial.db.routers.ReplicaRouter']
+
+#client that voted, commented or edited reads from primary for this many seconds
+REPLICA_PIN_SECONDS = int(os.environ.get('DB_REPLICA_PIN_SECONDS', '10'))
+REPLICA_PIN_COOKIE = 'pin_primary'
+
+
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+
+#NOTE: local memory cache is per process. Index invalidation (polls.cache),
+#'cache' throttle backend and cached shard sums are only shared by workers
+#with shared cache: set CACHE_MEMCACHED=host:port[,host:port] (needs
+#python-memcached) or point 'default' at another shared backend
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    } if not os.environ.get('CACHE_MEMCACHED') else {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': os.environ['CACHE_MEMCACHED'].split(','),
+    },
+    #rendered fragments of poll pages (choices, comments), keyed by question version
+    #so they never go stale, old versions are evicted
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'polls-fragments',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
 }
 
 
@@ -126,3 +194,136 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Logging
+# https://docs.djangoproject.com/en/2.2/topics/logging/
+
+#per-request metrics of polls.middleware.RequestMetricsMiddleware
+#are written here as JSON lines if set, see "manage.py metrics_report"
+POLLS_METRICS_LOG = os.environ.get('POLLS_METRICS_LOG')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'polls_metrics': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': POLLS_METRICS_LOG,
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'formatter': 'message',
+        } if POLLS_METRICS_LOG else {
+            'class': 'logging.NullHandler',
+        },
+    },
+    'loggers': {
+        'polls.metrics': {
+            'handlers': ['polls_metrics'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+
+# Polls
+
+#live results over Server-Sent Events, see polls/live.py
+#every watcher holds a worker thread for up to MAX_DURATION, so turn it on
+#(POLLS_LIVE_RESULTS=1) only with threaded or gevent workers,
+#for example gunicorn --worker-class gthread --threads 100
+POLLS_LIVE_RESULTS = {
+    'ENABLED': os.environ.get('POLLS_LIVE_RESULTS') == '1',
+    'TICK': 1.0,
+    'KEEPALIVE': 15,
+    'MAX_DURATION': 300,
+    'QUEUE_SIZE': 10,
+}
+
+#request metrics middleware, measures 1% of requests by default
+#set POLLS_METRICS_SAMPLE_RATE=1.0 to measure every request while profiling
+POLLS_METRICS = {
+    'SAMPLE_RATE': float(os.environ.get('POLLS_METRICS_SAMPLE_RATE', '0.01')),
+    'SERVER_TIMING_HEADER': True,
+}
+
+#seconds "top 5 recent questions" stay cached, see polls/cache.py
+POLLS_INDEX_CACHE_TIMEOUT = 300
+
+#seconds shared caches (CDN, reverse proxy) may serve results and comments
+#pages without asking, browsers always revalidate them with ETag
+#NOTE: voter behind such cache may see own vote only after this time
+POLLS_SHARED_CACHE_SECONDS = int(os.environ.get('POLLS_SHARED_CACHE_SECONDS', '5'))
+
+#comments shown per page on comments page
+POLLS_COMMENTS_PAGE_SIZE = 50
+
+#questions and comments shown by search page
+POLLS_SEARCH_LIMIT = 20
+
+#rows fetched per database round trip by streaming exports
+POLLS_EXPORT_CHUNK_SIZE = 2000
+
+#vote events and their per-minute/per-hour rollups, see polls/history.py
+#"manage.py rollup_votes" has to run periodically for trends to move
+POLLS_VOTE_HISTORY = {
+    'ENABLED': True,
+    'RAW_RETENTION_DAYS': int(os.environ.get('POLLS_VOTE_RAW_RETENTION_DAYS', '7')),
+    'MINUTE_RETENTION_DAYS': 30,
+    'ROLLUP_BATCH_SIZE': 10000,
+    'ROLLUP_LAG_SECONDS': 60,
+}
+
+#write-behind vote buffer, see polls/votes.py
+POLLS_VOTE_BUFFER = {
+    'ENABLED': os.environ.get('POLLS_VOTE_BUFFER') == '1',
+    'FLUSH_INTERVAL': 1.0,
+    'FLUSH_SIZE': 500,
+    'READ_YOUR_WRITES': True,
+}
+
+#rate limits and duplicate suppression of votes and comments, see polls/throttle.py
+#'cache' backend shares limits between workers only if CACHES['default']
+#is shared (CACHE_MEMCACHED), with local memory cache it is per process too
+POLLS_THROTTLE = {
+    'ENABLED': os.environ.get('POLLS_THROTTLE', '1') == '1',
+    'BACKEND': os.environ.get('POLLS_THROTTLE_BACKEND', 'local'),
+    'RATES': {
+        #(burst, tokens per second)
+        'vote': {'CLIENT': (10, 1.0), 'QUESTION': (500, 200.0)},
+        'comment': {'CLIENT': (5, 0.2), 'QUESTION': (100, 20.0)},
+    },
+    #same browser (CSRF cookie) voting or commenting twice within this time
+    #is dropped, voters behind one NAT are still counted one by one
+    #NOTE: client without cookies falls back to address, clearing cookies
+    #gets around dedup but not rate limits
+    'DEDUP_SECONDS': 10,
+}
+
+#queued comments written by worker thread in batches, see polls/comments.py
+POLLS_COMMENT_QUEUE = {
+    'ENABLED': os.environ.get('POLLS_COMMENT_QUEUE') == '1',
+    'MAX_SIZE': 10000,
+    'PUT_TIMEOUT': 0.5,
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 0.2,
+}
+
+#admin changelists and question change form, see polls/admin.py
+POLLS_ADMIN = {
+    'ESTIMATED_COUNT_THRESHOLD': 100000,
+    'INLINE_COMMENTS': 20,
+}
+
+#sharded vote counters, see polls/shards.py
+#"manage.py fold_vote_shards" has to run periodically to keep
+#votes and total_votes columns up to date, and once after turning it off
+POLLS_VOTE_SHARDS = {
+    'ENABLED': os.environ.get('POLLS_VOTE_SHARDS') == '1',
+    'SHARDS': int(os.environ.get('POLLS_VOTE_SHARDS_COUNT', '8')),
+    'CACHE_SECONDS': 2,
+}
@@ -0,0 +1,38 @@
+"""
+Settings for "manage.py test", used by default (see manage.py)
+
+Runs the suite on in-memory SQLite, so no database server or CREATE DATABASE
+permission is needed. Run against PostgreSQL with
+"manage.py test --settings=officialTutorial.settings".
+"""
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'officialTutorial.db.backends.sqlite3',
+        'NAME': ':memory:',
+    },
+    #same database under second alias, exercises read replica routing
+    #(see officialTutorial.tests.ReplicaRoutingIntegrationTests)
+    'replica': {
+        'ENGINE': 'officialTutorial.db.backends.sqlite3',
+        'NAME': ':memory:',
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+#routing is turned on only by the tests that check it
+DATABASE_REPLICAS = []
+
+#default PBKDF2 hasher is slow on purpose, test users don't need it
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+#NOTE: migrations stay enabled, search triggers and FTS5 tables
+#are created by RunPython in polls migrations (see polls/search.py)
+
+#tests vote and comment many times from one client,
+#throttling is turned on only by the tests that check it
+POLLS_THROTTLE = dict(POLLS_THROTTLE, ENABLED=False)  # noqa: F405
+
+#ids and versions of questions repeat between tests (rolled back rows),
+#so page fragments aren't cached unless a test turns it on
+CACHES = dict(CACHES, fragments={'BACKEND': 'django.core.cache.backends.dummy.DummyCache'})  # noqa: F405
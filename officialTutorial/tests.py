@@ -0,0 +1,215 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .db.backends.sqlite3.base import DatabaseWrapper
+from .db.middleware import ReplicaPinMiddleware
+from .db.pool import ConnectionPool, PoolTimeout, _ping
+from .db.routers import ReplicaRouter, allow_replica_reads, replica_reads_allowed
+
+def sqlite_pool(**kwargs):
+    return ConnectionPool(lambda: sqlite3.connect(':memory:', check_same_thread=False), _ping, **kwargs)
+
+class ConnectionPoolTests(SimpleTestCase):
+    """Tests for in-process connection pool"""
+    def test_returned_connection_is_reused(self):
+        """
+        Connection returned to pool is handed out again instead of opening new one
+        """
+        pool = sqlite_pool(size=1, max_overflow=0)
+        connection = pool.checkout()
+        pool.checkin(connection)
+        self.assertIs(pool.checkout(), connection)
+        stats = pool.stats()
+        self.assertEqual((stats['checkouts'], stats['connections_opened']), (2, 1))
+
+    def test_overflow_connections_are_closed_when_returned(self):
+        """
+        Connections over SIZE are opened under load and closed once returned
+        """
+        pool = sqlite_pool(size=1, max_overflow=1)
+        first, second = pool.checkout(), pool.checkout()
+        pool.checkin(first)
+        pool.checkin(second)
+        self.assertEqual((pool.stats()['opened'], pool.stats()['idle']), (1, 1))
+
+    def test_timeout_when_pool_is_exhausted(self):
+        """
+        Checkout waits TIMEOUT seconds for a free connection and gives up
+        """
+        pool = sqlite_pool(size=1, max_overflow=0, timeout=0.05)
+        pool.checkout()
+        with self.assertRaises(PoolTimeout):
+            pool.checkout()
+        stats = pool.stats()
+        self.assertEqual((stats['waits'], stats['timeouts']), (1, 1))
+
+    def test_waiting_checkout_gets_returned_connection(self):
+        """
+        Checkout blocked on full pool continues once connection is returned
+        """
+        pool = sqlite_pool(size=1, max_overflow=0, timeout=5)
+        connection = pool.checkout()
+        timer = threading.Timer(0.05, pool.checkin, args=(connection,))
+        timer.start()
+        self.assertIs(pool.checkout(), connection)
+        timer.join()
+
+    def test_broken_connection_is_replaced(self):
+        """
+        Idle connection failing ping is discarded and replaced with new one
+        """
+        pool = sqlite_pool(size=1, max_overflow=0, ping_after=0)
+        connection = pool.checkout()
+        pool.checkin(connection)
+        connection.close()
+        self.assertIsNot(pool.checkout(), connection)
+        self.assertEqual(pool.stats()['discarded'], 1)
+
+class PooledBackendTests(SimpleTestCase):
+    """Tests for backend using connection pool"""
+    def setUp(self):
+        database = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False)
+        database.close()
+        self.addCleanup(os.remove, database.name)
+        self.wrapper = DatabaseWrapper({
+            'NAME': database.name, 'USER': '', 'PASSWORD': '', 'HOST': '', 'PORT': '',
+            'OPTIONS': {}, 'TIME_ZONE': None, 'CONN_MAX_AGE': 0, 'AUTOCOMMIT': True,
+            'ATOMIC_REQUESTS': False, 'TEST': {}, 'HEALTH_CHECKS': True,
+            'POOL': {'SIZE': 1, 'MAX_OVERFLOW': 0},
+        }, alias='pool_test_{}'.format(id(self)))
+
+    def test_connection_is_reused_between_requests(self):
+        """
+        Closing Django connection returns it to pool, next query reuses it
+        """
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        first = self.wrapper.connection
+        self.wrapper.close()
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        self.assertIs(self.wrapper.connection, first)
+        self.wrapper.close()
+        self.assertEqual(self.wrapper._pool().stats()['connections_opened'], 1)
+
+    def test_health_check_replaces_broken_persistent_connection(self):
+        """
+        Connection that broke between requests is reopened before first query
+        """
+        self.wrapper.settings_dict['CONN_MAX_AGE'] = None
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        self.wrapper.connection.close()
+        #request boundary
+        self.wrapper.close_if_unusable_or_obsolete()
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        self.wrapper.close()
+        self.assertEqual(self.wrapper._pool().stats()['discarded'], 1)
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(SimpleTestCase):
+    """Tests for read replica router and primary pinning"""
+    def setUp(self):
+        self.addCleanup(allow_replica_reads, False)
+        from polls.models import Question
+        self.question_model = Question
+
+    def test_reads_go_to_replica_only_when_allowed(self):
+        """
+        Polls reads use replica inside safe request, primary otherwise
+        """
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(self.question_model), 'default')
+        allow_replica_reads(True)
+        self.assertEqual(router.db_for_read(self.question_model), 'replica')
+        self.assertEqual(router.db_for_write(self.question_model), 'default')
+
+    @override_settings(DATABASE_REPLICAS=['replica', 'replica2'])
+    def test_request_reads_from_one_replica(self):
+        """
+        Every read of one request goes to the replica picked when reads were allowed
+        """
+        router = ReplicaRouter()
+        allow_replica_reads(True)
+        self.assertEqual(len({router.db_for_read(self.question_model) for _ in range(20)}), 1)
+
+    def test_other_apps_read_from_primary(self):
+        """
+        Sessions and users are never read from replica
+        """
+        from django.contrib.auth.models import User
+        allow_replica_reads(True)
+        self.assertEqual(ReplicaRouter().db_for_read(User), 'default')
+
+    def test_replicas_arent_migrated(self):
+        router = ReplicaRouter()
+        self.assertTrue(router.allow_migrate('default', 'polls'))
+        self.assertFalse(router.allow_migrate('replica', 'polls'))
+
+    def middleware_state(self, request, status=200):
+        """Returns (replica reads allowed inside view, response) of request"""
+        seen = []
+
+        def view(request):
+            seen.append(replica_reads_allowed())
+            return HttpResponse(status=status)
+        response = ReplicaPinMiddleware(view)(request)
+        return seen[0], response
+
+    def test_write_pins_client_to_primary(self):
+        """
+        Successful POST reads from primary and sets pin cookie,
+        GET with the cookie keeps reading from primary
+        """
+        factory = RequestFactory()
+        allowed, response = self.middleware_state(factory.post('/polls/1/vote/'))
+        self.assertFalse(allowed)
+        cookie = response.cookies[settings.REPLICA_PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_PIN_SECONDS)
+
+        request = factory.get('/polls/1/results/')
+        request.COOKIES[settings.REPLICA_PIN_COOKIE] = cookie.value
+        self.assertFalse(self.middleware_state(request)[0])
+        self.assertTrue(self.middleware_state(factory.get('/polls/1/results/'))[0])
+
+    def test_failed_write_doesnt_pin(self):
+        allowed, response = self.middleware_state(RequestFactory().post('/polls/1/vote/'), status=404)
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+@unittest.skipUnless('replica' in settings.DATABASES, "needs 'replica' database mirroring 'default'")
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingIntegrationTests(TransactionTestCase):
+    """
+    Polls views against two configured databases
+    Data is committed, replica connection can't see uncommitted rows of TestCase
+    """
+    databases = {'default', 'replica'}
+
+    def test_read_views_query_replica_until_vote(self):
+        """
+        Results page reads from replica, after vote the same client reads from primary
+        """
+        from polls.models import Question
+        question = Question.objects.create(question_text="Replicated", pub_date=timezone.now())
+        choice = question.choice_set.create(choice_text="Choice")
+        results = reverse('polls:results', args=(question.id,))
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            self.client.get(results)
+        self.assertTrue(replica_queries)
+
+        self.client.post(reverse('polls:vote', args=(question.id,)), {'choice': choice.id})
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            self.client.get(results)
+        self.assertFalse(replica_queries)
@@ -1,12 +1,91 @@
+from django.conf import settings
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+from django.forms.models import BaseInlineFormSet
+from django.urls import reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
 from .models import Question, Choice, Comment
+from .search import question_search_filter
+
+ADMIN_DEFAULTS = {
+    #unfiltered changelists of tables with at least this many rows
+    #show planner estimate instead of running COUNT(*) (PostgreSQL only)
+    'ESTIMATED_COUNT_THRESHOLD': 100000,
+    #latest comments shown inline on question change form
+    'INLINE_COMMENTS': 20,
+}
+
+def admin_settings():
+    return {**ADMIN_DEFAULTS, **getattr(settings, 'POLLS_ADMIN', {})}
+
+def estimated_count(queryset):
+    """
+    Returns planner's row estimate (pg_class.reltuples) of unfiltered queryset
+    or None if queryset is filtered, database isn't PostgreSQL
+    or table was never analyzed
+    """
+    if queryset.query.where or connections[queryset.db].vendor != 'postgresql':
+        return None
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                       [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+    if row is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that doesn't COUNT(*) whole big table
+    Estimate is off by a few percent, so last pages may be empty or missing
+    """
+    @cached_property
+    def count(self):
+        estimate = estimated_count(self.object_list)
+        if estimate is not None and estimate >= admin_settings()['ESTIMATED_COUNT_THRESHOLD']:
+            return estimate
+        return super().count
+
+class LatestCommentsFormSet(BaseInlineFormSet):
+    """
+    Shows only latest INLINE_COMMENTS comments of question
+    Older ones are edited in comments changelist
+    """
+    def get_queryset(self):
+        if not hasattr(self, '_queryset'):
+            self._queryset = self.queryset.order_by('-id')[:admin_settings()['INLINE_COMMENTS']]
+        return self._queryset
+
+    def _existing_object(self, pk):
+        #comment posted meanwhile may push edited one out of latest comments
+        existing = super()._existing_object(pk)
+        if existing is None:
+            existing = self.queryset.filter(pk=pk).first()
+        return existing
 
 class ChoiceInLine(admin.TabularInline):
     model = Choice
     extra = 3
-    
+    readonly_fields = ['all_votes']
+
+    def get_queryset(self, request):
+        """Adds votes of sharded counters (see polls.shards) in the same query"""
+        return super().get_queryset(request).annotate(
+            shard_votes=Coalesce(Sum('choicevoteshard__votes'), 0))
+
+    def all_votes(self, choice):
+        """Votes column plus votes in shards not folded into it yet"""
+        return choice.votes + getattr(choice, 'shard_votes', 0)
+    all_votes.short_description = 'Total votes'
+
 class CommentInLine(admin.TabularInline):
     model = Comment
+    formset = LatestCommentsFormSet
+    verbose_name_plural = 'Latest comments'
 
 @admin.register(Question)
 class QuestionAdmin(admin.ModelAdmin):
@@ -15,11 +94,13 @@ class QuestionAdmin(admin.ModelAdmin):
         ('Date information', {
             'fields': ['pub_date']
             }
-        )
+        ),
+        ('Comments', {'fields': ['all_comments']}),
     ]
+    readonly_fields = ['all_comments']
     inlines = [ChoiceInLine, CommentInLine]
-    #NOTE: calculated fields are not sortable. There are tricks to make
-    #it work by overriding get_queryset tho
+    #NOTE: comment counters are stored on question, so they are sortable
+    #(see admin_order_field in models.py) and cost no extra queries
     list_display = (
         'question_text',
         'pub_date',
@@ -28,5 +109,63 @@ class QuestionAdmin(admin.ModelAdmin):
         'count_comments_positive',
         'count_comments_negative'
         )
-    list_filter = ['pub_date']
-    search_fields = ['question_text']
\ No newline at end of file
+    #year/month/day links filter by range of indexed pub_date,
+    #list_filter would count questions of every choice on every page load
+    date_hierarchy = 'pub_date'
+    search_fields = ['question_text']
+    paginator = EstimatedCountPaginator
+    #filtered page doesn't run second COUNT(*) of whole table
+    show_full_result_count = False
+
+    def all_comments(self, question):
+        """Link to paginated comments changelist of question"""
+        if question.pk is None:
+            return '-'
+        return format_html(
+            '<a href="{}?question__id__exact={}">All {} comments</a>',
+            reverse('admin:polls_comment_changelist'), question.pk, question.comment_count)
+    all_comments.short_description = 'Comments'
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Uses full-text index instead of ILIKE scan of search_fields
+        when database has one (see polls.search)
+        """
+        search_filter = question_search_filter(search_term, queryset.db) if search_term.split() else None
+        if search_filter is None:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(search_filter), False
+
+    def save_related(self, request, form, formsets, change):
+        """
+        Recalculates stored counters after inline choices and comments
+        were added, edited or deleted
+        """
+        super().save_related(request, form, formsets, change)
+        Question.objects.filter(pk=form.instance.pk).rebuild_counters()
+
+@admin.register(Comment)
+class CommentAdmin(admin.ModelAdmin):
+    list_display = ('comment_text', 'positive', 'question')
+    list_filter = ['positive']
+    list_select_related = ['question']
+    #question select box would load every question
+    raw_id_fields = ['question']
+    ordering = ['-id']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        #comment may have been moved from another question
+        question_ids = {obj.question_id, form.initial.get('question')}
+        Question.objects.filter(pk__in=question_ids - {None}).rebuild_counters()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        Question.objects.filter(pk=obj.question_id).rebuild_counters()
+
+    def delete_queryset(self, request, queryset):
+        question_ids = set(queryset.values_list('question_id', flat=True))
+        super().delete_queryset(request, queryset)
+        Question.objects.filter(pk__in=question_ids).rebuild_counters()
@@ -1,5 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class PollsConfig(AppConfig):
     name = 'polls'
+
+    def ready(self):
+        #connect signal handlers
+        from . import signals  # noqa: F401
+        from .search import restore_sqlite_triggers
+        post_migrate.connect(restore_sqlite_triggers, sender=self)
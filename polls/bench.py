@@ -0,0 +1,166 @@
+"""Helpers for polls benchmark commands"""
+import datetime
+import itertools
+import threading
+import time
+
+from django.db import connection
+from django.utils import timezone
+
+from .models import Question, Choice, Comment
+
+def percentile(sorted_values, percent):
+    """Returns nearest-rank percentile of already sorted values"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(percent / 100.0 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+def summarize(latencies, elapsed):
+    """
+    Returns dict with request count, requests per second
+    and p50/p95/p99 latency in milliseconds
+    """
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+    }
+
+def run_concurrently(workers, iterations, action):
+    """
+    Calls action(worker_number, iteration) iterations times in each of workers threads
+    Returns (latencies in seconds, elapsed wall time in seconds)
+    """
+    latencies = []
+    latencies_lock = threading.Lock()
+    start_barrier = threading.Barrier(workers + 1)
+
+    def worker(number):
+        own_latencies = []
+        try:
+            start_barrier.wait()
+            for iteration in range(iterations):
+                started = time.perf_counter()
+                action(number, iteration)
+                own_latencies.append(time.perf_counter() - started)
+        finally:
+            #every thread gets own database connection
+            connection.close()
+        with latencies_lock:
+            latencies.extend(own_latencies)
+
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(workers)]
+    for thread in threads:
+        thread.start()
+    start_barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - started
+
+#marks questions created by benchmarks so they can be found and removed
+BENCH_PREFIX = '[bench] '
+
+def seed_polls(questions, choices_per_question, comments, batch_size=5000, log=None):
+    """
+    Creates benchmark questions (published in the past) with choices and comments
+    spread evenly over them. Returns list of created question ids
+    """
+    now = timezone.now()
+    for start in range(0, questions, batch_size):
+        Question.objects.bulk_create(
+            Question(question_text='{}question {}'.format(BENCH_PREFIX, number),
+                     pub_date=now - datetime.timedelta(minutes=number))
+            for number in range(start, min(start + batch_size, questions))
+        )
+    question_ids = list(Question.objects
+                        .filter(question_text__startswith=BENCH_PREFIX)
+                        .order_by('id')
+                        .values_list('id', flat=True))[-questions:]
+    choices = (
+        Choice(question_id=question_id, choice_text='choice {}'.format(number))
+        for question_id in question_ids
+        for number in range(choices_per_question)
+    )
+    _bulk_create_in_batches(Choice, choices, batch_size)
+    comments = (
+        Comment(question_id=question_ids[number % len(question_ids)],
+                comment_text='comment {}'.format(number),
+                positive=number % 3 != 0)
+        for number in range(comments)
+    )
+    _bulk_create_in_batches(Comment, comments, batch_size, log)
+    Question.objects.filter(pk__in=question_ids).rebuild_counters()
+    return question_ids
+
+def _bulk_create_in_batches(model, objects, batch_size, log=None):
+    """bulk_create from generator without holding all objects in memory"""
+    created = 0
+    while True:
+        batch = list(itertools.islice(objects, batch_size))
+        if not batch:
+            return
+        model.objects.bulk_create(batch)
+        created += len(batch)
+        if log:
+            log("{} {} rows".format(created, model._meta.model_name))
+
+def parse_importtime(output):
+    """
+    Parses stderr of "python -X importtime"
+    Returns list of (module, self us, cumulative us, nesting depth) in import order
+    """
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            #header line
+            continue
+        name = fields[2].rstrip()
+        stripped = name.lstrip()
+        #every nesting level is indented by two spaces after the separator space
+        depth = (len(name) - len(stripped) - 1) // 2
+        entries.append((stripped, int(fields[0]), int(fields[1]), depth))
+    return entries
+
+def summarize_imports(entries, top=10):
+    """
+    Returns total import time in milliseconds (sum of top level imports)
+    and top slowest modules by cumulative time
+    """
+    total_us = sum(cumulative for _, _, cumulative, depth in entries if depth == 0)
+    slowest = sorted(entries, key=lambda entry: entry[2], reverse=True)[:top]
+    return {
+        'modules': len(entries),
+        'total_ms': round(total_us / 1000, 3),
+        'slowest': [{'module': module, 'cumulative_ms': round(cumulative / 1000, 3)}
+                    for module, _, cumulative, _ in slowest],
+    }
+
+def compare_results(baseline, current, tolerance):
+    """
+    Compares route results of two benchmark runs
+    Returns list of (route, metric, baseline value, current value, regressed)
+    Latency regresses if it grows by more than tolerance (0.1 is 10%),
+    throughput and query count regress if throughput drops or queries grow
+    """
+    rows = []
+    for route, result in current['routes'].items():
+        old = baseline['routes'].get(route)
+        if old is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+            rows.append((route, metric, old[metric], result[metric],
+                         result[metric] > old[metric] * (1 + tolerance)))
+        rows.append((route, 'rps', old['rps'], result['rps'],
+                     result['rps'] < old['rps'] * (1 - tolerance)))
+        if old.get('queries') is not None and result.get('queries') is not None:
+            rows.append((route, 'queries', old['queries'], result['queries'],
+                         result['queries'] > old['queries']))
+    return rows
@@ -0,0 +1,43 @@
+"""polls caching helpers"""
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Question
+
+INDEX_CACHE_KEY = 'polls:index'
+
+def index_cache_timeout(now):
+    """
+    Returns seconds index may stay cached: POLLS_INDEX_CACHE_TIMEOUT or
+    less if scheduled question goes live earlier
+    """
+    timeout = settings.POLLS_INDEX_CACHE_TIMEOUT
+    next_pub_date = (Question.objects
+                     .using('default')
+                     .filter(pub_date__gt=now)
+                     .order_by('pub_date')
+                     .values_list('pub_date', flat=True)
+                     .first())
+    if next_pub_date is not None:
+        timeout = min(timeout, (next_pub_date - now).total_seconds())
+    return timeout
+
+def latest_questions():
+    """
+    Returns the last five published questions
+    Cached until any question changes (see polls.signals)
+    or next future question gets published
+    Refill reads primary, replica lagging behind the write that invalidated
+    cache would store index without the new question
+    """
+    questions = cache.get(INDEX_CACHE_KEY)
+    if questions is None:
+        now = timezone.now()
+        questions = list(Question.objects.using('default')
+                         .filter(pub_date__lte=now).order_by('-pub_date')[:5])
+        cache.set(INDEX_CACHE_KEY, questions, index_cache_timeout(now))
+    return questions
+
+def invalidate_index():
+    cache.delete(INDEX_CACHE_KEY)
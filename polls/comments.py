@@ -0,0 +1,175 @@
+"""
+Comment recording
+
+By default every comment is INSERTed in request thread (question counters
+are bumped by polls.signals). With POLLS_COMMENT_QUEUE['ENABLED'] validated
+comments are put on a bounded in-process queue and a worker thread writes
+them with one bulk INSERT per batch, so insert throughput grows with batch
+size instead of with transaction count.
+"""
+import atexit
+import queue
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .expressions import sum_case
+from .models import Question, Comment
+
+COMMENT_QUEUE_DEFAULTS = {
+    'ENABLED': False,
+    #comments waiting to be written, request waits PUT_TIMEOUT when queue is full
+    'MAX_SIZE': 10000,
+    'PUT_TIMEOUT': 0.5,
+    #comments per bulk INSERT
+    'BATCH_SIZE': 500,
+    #seconds worker waits for batch to fill up
+    'FLUSH_INTERVAL': 0.2,
+}
+
+def comment_queue_settings():
+    return {**COMMENT_QUEUE_DEFAULTS, **getattr(settings, 'POLLS_COMMENT_QUEUE', {})}
+
+def apply_comments(comments):
+    """
+    Writes comments and their question counters
+    bulk_create sends no post_save, so counters of all questions are
+    updated by one statement per counter set instead of polls.signals
+    """
+    comment_deltas = Counter()
+    positive_deltas = Counter()
+    negative_deltas = Counter()
+    for comment in comments:
+        comment_deltas[comment.question_id] += 1
+        if comment.positive:
+            positive_deltas[comment.question_id] += 1
+        else:
+            negative_deltas[comment.question_id] += 1
+    with transaction.atomic():
+        Comment.objects.bulk_create(comments)
+        Question.objects.filter(pk__in=comment_deltas).update(
+            comment_count=F('comment_count') + sum_case(comment_deltas),
+            positive_count=F('positive_count') + sum_case(positive_deltas),
+            negative_count=F('negative_count') + sum_case(negative_deltas),
+            modified=timezone.now(),
+            version=F('version') + 1)
+
+class CommentQueue:
+    """
+    Bounded queue of unsaved comments drained by worker thread in batches
+    If batch fails (question deleted meanwhile), its comments are written
+    one by one so only the broken ones are lost
+    """
+    def __init__(self, max_size=10000, batch_size=500, flush_interval=0.2, apply=apply_comments):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._apply = apply
+        self._queue = queue.Queue(maxsize=max_size)
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def put(self, comment, timeout=0.5):
+        """Queues comment, returns False if queue stayed full for timeout seconds"""
+        if self._stopped.is_set():
+            return False
+        try:
+            self._queue.put(comment, timeout=timeout)
+        except queue.Full:
+            return False
+        return True
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def _next_batch(self, wait):
+        """Returns up to batch_size comments, waits wait seconds for the first one"""
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=wait) if wait else self._queue.get_nowait())
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write(self, batch):
+        try:
+            self._apply(batch)
+        except IntegrityError:
+            for comment in batch:
+                try:
+                    self._apply([comment])
+                except IntegrityError:
+                    pass
+
+    def flush(self):
+        """Writes everything queued so far, returns amount of written comments"""
+        written = 0
+        while True:
+            batch = self._next_batch(wait=0)
+            if not batch:
+                return written
+            self._write(batch)
+            written += len(batch)
+
+    def start(self):
+        """Starts worker thread"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='comment-queue', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops taking comments, lets worker finish and writes what is left"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        try:
+            while not self._stopped.is_set():
+                batch = self._next_batch(wait=self.flush_interval)
+                if not batch:
+                    continue
+                close_old_connections()
+                try:
+                    self._write(batch)
+                except Exception:
+                    #comments of failed batch go back to queue for next try
+                    #NOTE: they may be dropped if queue filled up meanwhile
+                    for comment in batch:
+                        try:
+                            self._queue.put_nowait(comment)
+                        except queue.Full:
+                            break
+                    connection.close()
+                    self._stopped.wait(self.flush_interval)
+        finally:
+            connection.close()
+
+_comment_queue = None
+_comment_queue_lock = threading.Lock()
+
+def get_comment_queue():
+    """
+    Returns process-wide CommentQueue with started worker or None if disabled
+    Queue is drained on interpreter shutdown
+    """
+    global _comment_queue
+    options = comment_queue_settings()
+    if not options['ENABLED']:
+        return None
+    if _comment_queue is None:
+        with _comment_queue_lock:
+            if _comment_queue is None:
+                comment_queue = CommentQueue(options['MAX_SIZE'], options['BATCH_SIZE'], options['FLUSH_INTERVAL'])
+                comment_queue.start()
+                atexit.register(comment_queue.stop)
+                _comment_queue = comment_queue
+    return _comment_queue
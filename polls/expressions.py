@@ -0,0 +1,13 @@
+"""Query expressions shared by polls batch writers"""
+from django.db.models import Case, IntegerField, Value, When
+
+def sum_case(deltas):
+    """
+    Returns CASE pk WHEN ... THEN delta expression for {pk: delta}
+    Lets one UPDATE add different amounts to many rows
+    """
+    return Case(
+        *[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
@@ -0,0 +1,174 @@
+"""
+Vote history
+
+Vote paths append VoteEvent rows (one per vote, one per choice and batch
+with vote buffer). "manage.py rollup_votes" sums events into per-minute
+and per-hour VoteBucket rows, remembering last rolled up event id in a
+Checkpoint, and deletes events and minute buckets past their retention.
+Trend queries read only buckets, so their cost depends on the time range
+and not on the amount of votes.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncHour, TruncMinute
+from django.utils import timezone
+
+from .expressions import sum_case
+from .models import Choice, Checkpoint, VoteBucket, VoteEvent
+
+VOTE_HISTORY_DEFAULTS = {
+    'ENABLED': True,
+    #days raw events are kept after they were rolled up, None keeps them forever
+    'RAW_RETENTION_DAYS': 7,
+    #days minute buckets are kept, hour buckets are kept forever
+    'MINUTE_RETENTION_DAYS': 30,
+    #events rolled up per transaction
+    'ROLLUP_BATCH_SIZE': 10000,
+    #events younger than this are left for next rollup, ids of concurrent
+    #transactions can commit out of order and checkpoint would skip them
+    'ROLLUP_LAG_SECONDS': 60,
+}
+
+ROLLUP_CHECKPOINT = 'vote_rollup'
+
+#buckets are aligned to UTC, so hours don't depend on TIME_ZONE
+TRUNCATE = {
+    VoteBucket.MINUTE: lambda field: TruncMinute(field, tzinfo=timezone.utc),
+    VoteBucket.HOUR: lambda field: TruncHour(field, tzinfo=timezone.utc),
+}
+
+BUCKET_SIZE = {
+    VoteBucket.MINUTE: datetime.timedelta(minutes=1),
+    VoteBucket.HOUR: datetime.timedelta(hours=1),
+}
+
+def vote_history_settings():
+    return {**VOTE_HISTORY_DEFAULTS, **getattr(settings, 'POLLS_VOTE_HISTORY', {})}
+
+def record_events(votes, created=None):
+    """
+    Appends events of votes ({(question_id, choice_id): amount}) in one INSERT
+    Does nothing if vote history is disabled
+    """
+    if not votes or not vote_history_settings()['ENABLED']:
+        return
+    created = created or timezone.now()
+    VoteEvent.objects.bulk_create(
+        VoteEvent(question_id=question_id, choice_id=choice_id, created=created, count=amount)
+        for (question_id, choice_id), amount in votes.items()
+    )
+
+def _add_to_buckets(resolution, events):
+    """Adds votes of events queryset to buckets of resolution"""
+    rows = (events
+            .annotate(start=TRUNCATE[resolution]('created'))
+            .values('question_id', 'choice_id', 'start')
+            .order_by()
+            .annotate(votes=Sum('count')))
+    deltas = {(row['choice_id'], row['start']): row for row in rows}
+    if not deltas:
+        return
+    existing = (VoteBucket.objects
+                .filter(resolution=resolution,
+                        choice_id__in={choice_id for choice_id, _ in deltas},
+                        start__in={start for _, start in deltas})
+                .values_list('choice_id', 'start', 'id'))
+    updates = {}
+    for choice_id, start, pk in existing:
+        row = deltas.pop((choice_id, start), None)
+        if row is not None:
+            updates[pk] = row['votes']
+    if updates:
+        VoteBucket.objects.filter(pk__in=updates).update(votes=F('votes') + sum_case(updates))
+    VoteBucket.objects.bulk_create(
+        VoteBucket(question_id=row['question_id'], choice_id=row['choice_id'],
+                   resolution=resolution, start=row['start'], votes=row['votes'])
+        for row in deltas.values()
+    )
+
+def rollup_batch(batch_size, lag_seconds=60, now=None):
+    """
+    Rolls up next batch of events into buckets together with checkpoint
+    Batch ends before first event younger than lag_seconds
+    Returns amount of rolled up events, 0 when there is nothing left
+    """
+    cutoff = (now or timezone.now()) - datetime.timedelta(seconds=lag_seconds)
+    with transaction.atomic():
+        checkpoint, _ = Checkpoint.objects.select_for_update().get_or_create(name=ROLLUP_CHECKPOINT)
+        ids = []
+        for pk, created in (VoteEvent.objects
+                            .filter(id__gt=checkpoint.position)
+                            .order_by('id')
+                            .values_list('id', 'created')[:batch_size]):
+            if created >= cutoff:
+                break
+            ids.append(pk)
+        if not ids:
+            return 0
+        events = VoteEvent.objects.filter(id__gt=checkpoint.position, id__lte=ids[-1])
+        for resolution in (VoteBucket.MINUTE, VoteBucket.HOUR):
+            _add_to_buckets(resolution, events)
+        checkpoint.position = ids[-1]
+        checkpoint.save(update_fields=['position'])
+    return len(ids)
+
+def _delete_in_batches(queryset, batch_size):
+    """Deletes rows in batches of primary keys, so no statement locks whole table"""
+    deleted = 0
+    while True:
+        ids = list(queryset.order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        #history models have no relations or signals, so this is a single DELETE
+        deleted += queryset.model.objects.filter(id__in=ids).delete()[0]
+
+def purge(now=None):
+    """
+    Deletes rolled up events and minute buckets older than their retention
+    Returns (deleted events, deleted minute buckets)
+    """
+    options = vote_history_settings()
+    now = now or timezone.now()
+    batch_size = options['ROLLUP_BATCH_SIZE']
+    deleted_events = deleted_buckets = 0
+    if options['RAW_RETENTION_DAYS'] is not None:
+        rolled_up = (Checkpoint.objects
+                     .filter(name=ROLLUP_CHECKPOINT)
+                     .values_list('position', flat=True)
+                     .first()) or 0
+        deleted_events = _delete_in_batches(
+            VoteEvent.objects.filter(
+                id__lte=rolled_up,
+                created__lt=now - datetime.timedelta(days=options['RAW_RETENTION_DAYS'])),
+            batch_size)
+    if options['MINUTE_RETENTION_DAYS'] is not None:
+        deleted_buckets = _delete_in_batches(
+            VoteBucket.objects.filter(
+                resolution=VoteBucket.MINUTE,
+                start__lt=now - datetime.timedelta(days=options['MINUTE_RETENTION_DAYS'])),
+            batch_size)
+    return deleted_events, deleted_buckets
+
+def vote_trend(question_id, resolution=VoteBucket.HOUR, since=None, until=None):
+    """
+    Returns [(bucket start, {choice_id: votes})] of question in time order
+    Only buckets with votes are listed. Reads rollups, so votes newer than
+    last rollup are not included
+    """
+    until = until or timezone.now()
+    since = since or until - 24 * BUCKET_SIZE[resolution]
+    rows = (VoteBucket.objects
+            .filter(question_id=question_id, resolution=resolution,
+                    start__gte=since, start__lt=until,
+                    choice_id__in=Choice.objects.filter(question_id=question_id).values('id'))
+            .order_by('start')
+            .values_list('start', 'choice_id', 'votes'))
+    trend = []
+    for start, choice_id, votes in rows:
+        if not trend or trend[-1][0] != start:
+            trend.append((start, {}))
+        trend[-1][1][choice_id] = votes
+    return trend
@@ -0,0 +1,153 @@
+"""
+Live results
+
+Vote view marks question as changed in ResultsHub. Once per tick hub reads
+tallies of all changed questions that have watchers in one query and
+pushes only changed choices to every watcher, so N watchers of a hot poll
+cost one query per tick instead of N page reloads.
+
+Off by default: every watcher holds a worker thread for up to MAX_DURATION,
+sync WSGI workers (gunicorn's default) would all be taken by a few results
+pages. Turn it on only with threaded or gevent workers.
+"""
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from .models import Choice
+from .votes import pending_votes
+
+LIVE_RESULTS_DEFAULTS = {
+    #results page opens stream and stream view answers, see module docstring
+    'ENABLED': False,
+    #seconds between pushes, votes within a tick are sent as one update
+    'TICK': 1.0,
+    #seconds between keep-alive comments on idle stream
+    'KEEPALIVE': 15,
+    #seconds after which stream is closed, browser reconnects by itself
+    'MAX_DURATION': 300,
+    #updates kept for slow watcher before older ones are dropped
+    'QUEUE_SIZE': 10,
+}
+
+def live_results_settings():
+    return {**LIVE_RESULTS_DEFAULTS, **getattr(settings, 'POLLS_LIVE_RESULTS', {})}
+
+def fetch_tallies(question_ids):
+    """Returns {question_id: {choice_id: votes}} including votes still in vote buffer"""
+    tallies = {question_id: {} for question_id in question_ids}
+    rows = Choice.objects.filter(question_id__in=question_ids).values_list('question_id', 'id', 'votes')
+    for question_id, choice_id, votes in rows:
+        tallies[question_id][choice_id] = votes
+    for question_id, choices in tallies.items():
+        for choice_id, votes in pending_votes(question_id).items():
+            if choice_id in choices:
+                choices[choice_id] += votes
+    return tallies
+
+class ResultsHub:
+    """In-process pub/sub of changed choice tallies"""
+    def __init__(self, tick=1.0, queue_size=10, fetch=fetch_tallies):
+        self.tick = tick
+        self.queue_size = queue_size
+        self._fetch = fetch
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._snapshots = {}
+        self._dirty = set()
+        self._thread = None
+
+    def subscribe(self, question_id):
+        """Returns queue that receives {choice_id: votes} of changed choices"""
+        updates = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(question_id, set()).add(updates)
+        return updates
+
+    def unsubscribe(self, question_id, updates):
+        with self._lock:
+            subscribers = self._subscribers.get(question_id)
+            if subscribers is not None:
+                subscribers.discard(updates)
+                if not subscribers:
+                    del self._subscribers[question_id]
+                    self._snapshots.pop(question_id, None)
+
+    def notify(self, question_id):
+        """Marks question as changed, costs nothing if nobody watches it"""
+        with self._lock:
+            if question_id in self._subscribers:
+                self._dirty.add(question_id)
+
+    def publish(self):
+        """Sends changes of questions marked since last call, returns amount of updated questions"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return 0
+        tallies = self._fetch(dirty)
+        published = 0
+        with self._lock:
+            for question_id, choices in tallies.items():
+                subscribers = self._subscribers.get(question_id)
+                if not subscribers:
+                    continue
+                snapshot = self._snapshots.get(question_id, {})
+                changes = {choice_id: votes for choice_id, votes in choices.items()
+                           if snapshot.get(choice_id) != votes}
+                self._snapshots[question_id] = choices
+                if not changes:
+                    continue
+                published += 1
+                for updates in subscribers:
+                    _put_dropping_oldest(updates, changes)
+        return published
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='results-hub', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.tick)
+            close_old_connections()
+            try:
+                self.publish()
+            except Exception:
+                connection.close()
+
+def _put_dropping_oldest(updates, changes):
+    """Slow watcher loses oldest update, not the newest one"""
+    while True:
+        try:
+            updates.put_nowait(changes)
+            return
+        except queue.Full:
+            try:
+                updates.get_nowait()
+            except queue.Empty:
+                pass
+
+_results_hub = None
+_results_hub_lock = threading.Lock()
+
+def notify_results_changed(question_id):
+    """Tells hub about new vote, does nothing until somebody watches live results"""
+    if _results_hub is not None:
+        _results_hub.notify(question_id)
+
+def get_results_hub():
+    """Returns process-wide ResultsHub with started ticker thread"""
+    global _results_hub
+    if _results_hub is None:
+        with _results_hub_lock:
+            if _results_hub is None:
+                options = live_results_settings()
+                results_hub = ResultsHub(options['TICK'], options['QUEUE_SIZE'])
+                results_hub.start()
+                _results_hub = results_hub
+    return _results_hub
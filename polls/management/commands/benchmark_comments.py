@@ -0,0 +1,53 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from polls.bench import run_concurrently, summarize
+from polls.comments import CommentQueue
+from polls.models import Question, Comment
+
+class Command(BaseCommand):
+    help = (
+        "Compares comment throughput of one INSERT transaction per comment "
+        "with queued bulk INSERTs of each given batch size. Creates scratch "
+        "question in configured database and deletes it afterwards"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help="concurrent threads")
+        parser.add_argument('--comments', type=int, default=500, help="comments per writer")
+        parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 50, 500])
+
+    def handle(self, *args, **options):
+        results = {'row': self.run_mode(None, options)}
+        for batch_size in options['batch_sizes']:
+            results['queued_{}'.format(batch_size)] = self.run_mode(batch_size, options)
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def run_mode(self, batch_size, options):
+        question = Question.objects.create(
+            question_text="benchmark_comments scratch question", pub_date=timezone.now())
+        try:
+            if batch_size is None:
+                def comment(worker, iteration):
+                    Comment.objects.create(question_id=question.pk, comment_text="comment")
+                latencies, elapsed = run_concurrently(options['writers'], options['comments'], comment)
+            else:
+                comment_queue = CommentQueue(
+                    max_size=options['writers'] * options['comments'], batch_size=batch_size)
+                comment_queue.start()
+                def comment(worker, iteration):
+                    comment_queue.put(Comment(question_id=question.pk, comment_text="comment"))
+                latencies, elapsed = run_concurrently(options['writers'], options['comments'], comment)
+                #comments only count once they are in database
+                started = time.perf_counter()
+                comment_queue.stop()
+                elapsed += time.perf_counter() - started
+            question.refresh_from_db()
+            result = summarize(latencies, elapsed)
+            result['comments_in_database'] = question.comment_count
+            return result
+        finally:
+            question.delete()
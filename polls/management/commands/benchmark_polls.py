@@ -0,0 +1,216 @@
+import http.cookiejar
+import json
+import random
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from polls.bench import BENCH_PREFIX, compare_results, run_concurrently, seed_polls, summarize
+from polls.models import Question, Choice
+
+ROUTES = ['index', 'detail', 'results', 'comments', 'vote', 'leave_comment']
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Measures POST itself, not the page it redirects to"""
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+def route_request(route, question_id, choice_ids):
+    """Returns (method, path, POST data) for route and question"""
+    if route == 'index':
+        return 'GET', reverse('polls:index'), None
+    if route == 'vote':
+        return 'POST', reverse('polls:vote', args=(question_id,)), {'choice': random.choice(choice_ids)}
+    if route == 'leave_comment':
+        return 'POST', reverse('polls:leave_comment', args=(question_id,)), {
+            'comment_text': 'benchmark comment', 'is_positive': random.choice(['True', 'False'])}
+    return 'GET', reverse('polls:{}'.format(route), args=(question_id,)), None
+
+class TestClientDriver:
+    """Calls views in process with Django test client, counts queries"""
+    def __init__(self):
+        self.local = threading.local()
+
+    def request(self, method, path, data):
+        if not hasattr(self.local, 'client'):
+            #DEBUG settings only allow localhost as host
+            self.local.client = Client(SERVER_NAME='localhost')
+        with CaptureQueriesContext(connection) as queries:
+            if method == 'POST':
+                response = self.local.client.post(path, data)
+            else:
+                response = self.local.client.get(path)
+        if response.status_code >= 400:
+            raise CommandError("{} {} returned {}".format(method, path, response.status_code))
+        return len(queries)
+
+    def close(self):
+        pass
+
+class WSGIDriver:
+    """Calls views over HTTP through officialTutorial.wsgi application"""
+    def __init__(self, csrf_path):
+        from officialTutorial.wsgi import application
+        self.csrf_path = csrf_path
+        self.server = make_server('localhost', 0, application,
+                                  server_class=ThreadingWSGIServer, handler_class=QuietHandler)
+        self.base_url = 'http://localhost:{}'.format(self.server.server_port)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.local = threading.local()
+
+    def opener(self):
+        if not hasattr(self.local, 'opener'):
+            cookies = http.cookiejar.CookieJar()
+            self.local.opener = urllib.request.build_opener(
+                urllib.request.HTTPCookieProcessor(cookies), NoRedirect)
+            self.local.cookies = cookies
+            #page with a form sets CSRF cookie for POST requests
+            self.local.opener.open(self.base_url + self.csrf_path).read()
+        return self.local.opener
+
+    def request(self, method, path, data):
+        opener = self.opener()
+        if method == 'POST':
+            token = next((cookie.value for cookie in self.local.cookies if cookie.name == 'csrftoken'), '')
+            request = urllib.request.Request(
+                self.base_url + path, data=urllib.parse.urlencode(data).encode(),
+                headers={'X-CSRFToken': token})
+        else:
+            request = urllib.request.Request(self.base_url + path)
+        try:
+            opener.open(request).read()
+        except urllib.error.HTTPError as error:
+            if error.code >= 400:
+                raise CommandError("{} {} returned {}".format(method, path, error.code))
+        return None
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class Command(BaseCommand):
+    help = (
+        "Measures latency, throughput and query count of polls routes. "
+        "Seeds benchmark questions in configured database (use a local one), "
+        "drives views with test client or real WSGI server and can save "
+        "results as baseline and compare against it"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', type=int, default=1000)
+        parser.add_argument('--choices', type=int, default=3, help="choices per question")
+        parser.add_argument('--comments', type=int, default=10000, help="comments in total")
+        parser.add_argument('--no-seed', action='store_true', help="reuse already seeded data")
+        parser.add_argument('--cleanup', action='store_true', help="delete seeded data afterwards")
+        parser.add_argument('--routes', nargs='+', choices=ROUTES, default=ROUTES)
+        parser.add_argument('--requests', type=int, default=200, help="requests per route and client")
+        parser.add_argument('--concurrency', type=int, default=1, help="concurrent clients")
+        parser.add_argument('--driver', choices=['client', 'wsgi'], default='client')
+        parser.add_argument('--output', help="save results as JSON baseline")
+        parser.add_argument('--compare', help="baseline JSON to compare results with")
+        parser.add_argument('--tolerance', type=float, default=0.1,
+                            help="allowed relative slowdown before compare fails")
+        parser.add_argument('--throttle', action='store_true',
+                            help="keep vote and comment throttling on (all requests come from one client)")
+
+    def handle(self, *args, **options):
+        if not options['no_seed']:
+            self.stdout.write("Seeding data")
+            seed_polls(options['questions'], options['choices'], options['comments'],
+                       log=self.stdout.write if options['verbosity'] > 1 else None)
+        question_choices = self.question_choices()
+        if not question_choices:
+            raise CommandError("No benchmark questions, run without --no-seed")
+
+        if options['driver'] == 'client':
+            driver = TestClientDriver()
+        else:
+            driver = WSGIDriver(reverse('polls:detail', args=(next(iter(question_choices)),)))
+        #one client voting again and again would be answered by throttle, not by database
+        throttle = dict(settings.POLLS_THROTTLE, ENABLED=options['throttle'])
+        try:
+            with override_settings(POLLS_THROTTLE=throttle):
+                routes = {route: self.run_route(driver, route, question_choices, options)
+                          for route in options['routes']}
+        finally:
+            driver.close()
+        result = {
+            'meta': {
+                'driver': options['driver'],
+                'concurrency': options['concurrency'],
+                'requests': options['requests'],
+                'questions': len(question_choices),
+                'comments': options['comments'],
+                'database': connection.vendor,
+                'django': django.get_version(),
+            },
+            'routes': routes,
+        }
+        self.stdout.write(json.dumps(result, indent=2))
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(result, output, indent=2)
+        if options['cleanup']:
+            Question.objects.filter(question_text__startswith=BENCH_PREFIX).delete()
+        if options['compare']:
+            self.compare(options['compare'], result, options['tolerance'])
+
+    def question_choices(self):
+        """Returns {question id: [choice ids]} of benchmark questions"""
+        question_choices = {}
+        rows = (Choice.objects
+                .filter(question__question_text__startswith=BENCH_PREFIX)
+                .values_list('question_id', 'id'))
+        for question_id, choice_id in rows.iterator():
+            question_choices.setdefault(question_id, []).append(choice_id)
+        return question_choices
+
+    def run_route(self, driver, route, question_choices, options):
+        question_ids = list(question_choices)
+        if route == 'comments':
+            #comments page is 404 for questions without comments
+            question_ids = list(Question.objects
+                                .filter(pk__in=question_ids, comment_count__gt=0)
+                                .values_list('id', flat=True))
+        query_counts = []
+
+        def action(worker, iteration):
+            question_id = random.choice(question_ids)
+            queries = driver.request(*route_request(route, question_id, question_choices[question_id]))
+            if queries is not None:
+                query_counts.append(queries)
+
+        latencies, elapsed = run_concurrently(options['concurrency'], options['requests'], action)
+        result = summarize(latencies, elapsed)
+        result['queries'] = max(query_counts) if query_counts else None
+        return result
+
+    def compare(self, path, result, tolerance):
+        with open(path) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = []
+        for route, metric, old, new, regressed in compare_results(baseline, result, tolerance):
+            self.stdout.write("{:<14} {:<8} {:>10} -> {:>10}{}".format(
+                route, metric, old, new, "  REGRESSION" if regressed else ""))
+            if regressed:
+                regressions.append("{} {}".format(route, metric))
+        if regressions:
+            raise CommandError("Regressions: {}".format(", ".join(regressions)))
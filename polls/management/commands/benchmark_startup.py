@@ -0,0 +1,107 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.bench import parse_importtime, summarize_imports
+
+#runs in fresh interpreter, times Django setup and first two requests
+#through WSGI application without test client or server
+FIRST_REQUEST_PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+ready = time.perf_counter()
+from wsgiref.util import setup_testing_defaults
+
+def request(path):
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'HTTP_HOST': 'localhost'}
+    setup_testing_defaults(environ)
+    status = []
+    request_started = time.perf_counter()
+    response = application(environ, lambda value, headers, exc_info=None: status.append(value))
+    for _ in response:
+        pass
+    response.close()
+    return status[0], (time.perf_counter() - request_started) * 1000
+
+first_status, first_ms = request(sys.argv[1])
+_, second_ms = request(sys.argv[1])
+print(json.dumps({
+    'setup_ms': (ready - started) * 1000,
+    'first_request_ms': first_ms,
+    'second_request_ms': second_ms,
+    'status': first_status,
+}))
+'''
+
+class Command(BaseCommand):
+    help = (
+        "Measures cold start of settings profiles in fresh interpreters: "
+        "import time of 'manage.py check' (python -X importtime), Django setup "
+        "and first request. Fails if first request is slower than --max-first-request-ms"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', nargs='+',
+                            default=['officialTutorial.settings', 'officialTutorial.public_settings'],
+                            help="settings modules to measure")
+        parser.add_argument('--path', default='/polls/', help="URL of first request")
+        parser.add_argument('--runs', type=int, default=3, help="fresh processes per profile, median is reported")
+        parser.add_argument('--top', type=int, default=10, help="slowest imports to list")
+        parser.add_argument('--output', help="save results as JSON")
+        parser.add_argument('--max-first-request-ms', type=float,
+                            help="fail if cold start plus first request takes longer")
+
+    def handle(self, *args, **options):
+        results = {profile: self.measure(profile, options) for profile in options['profiles']}
+        self.stdout.write(json.dumps(results, indent=2))
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+        limit = options['max_first_request_ms']
+        if limit is not None:
+            slow = [profile for profile, result in results.items() if result['cold_request_ms'] > limit]
+            if slow:
+                raise CommandError("Cold start over {} ms: {}".format(limit, ", ".join(slow)))
+
+    def run(self, profile, command):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=profile)
+        started = time.perf_counter()
+        process = subprocess.run(command, cwd=settings.BASE_DIR, env=env,
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if process.returncode != 0:
+            raise CommandError("{} failed with {}:\n{}".format(profile, command, process.stderr[-2000:]))
+        return process, elapsed_ms
+
+    def measure(self, profile, options):
+        manage = os.path.join(settings.BASE_DIR, 'manage.py')
+        check_ms, probes, imports = [], [], None
+        for _ in range(options['runs']):
+            process, elapsed_ms = self.run(profile, [sys.executable, '-X', 'importtime', manage, 'check'])
+            check_ms.append(elapsed_ms)
+            imports = summarize_imports(parse_importtime(process.stderr), options['top'])
+            process, elapsed_ms = self.run(profile, [sys.executable, '-c', FIRST_REQUEST_PROBE, options['path']])
+            probe = json.loads(process.stdout.strip().splitlines()[-1])
+            probe['process_ms'] = elapsed_ms
+            probes.append(probe)
+
+        def median(key):
+            return round(statistics.median(probe[key] for probe in probes), 3)
+        return {
+            'check_process_ms': round(statistics.median(check_ms), 3),
+            'imports': imports,
+            'setup_ms': median('setup_ms'),
+            'first_request_ms': median('first_request_ms'),
+            'second_request_ms': median('second_request_ms'),
+            #interpreter start, setup and first request together
+            'cold_request_ms': median('process_ms'),
+            'status': probes[-1]['status'],
+        }
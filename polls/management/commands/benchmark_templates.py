@@ -0,0 +1,76 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.template import Context, Engine, engines
+
+from polls.bench import seed_polls, summarize
+from polls.models import Question
+from polls.views import CommentsPage
+
+LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
+class Command(BaseCommand):
+    help = (
+        "Compares rendering of detail and comments templates: cold (parsed "
+        "on every render, as with DEBUG), parsed once by cached loader, and "
+        "with warm fragment cache. Creates scratch question with many choices "
+        "and comments in configured database and deletes it afterwards"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--choices', type=int, default=200)
+        parser.add_argument('--comments', type=int, default=2000)
+        parser.add_argument('--iterations', type=int, default=200)
+
+    def handle(self, *args, **options):
+        question_id, = seed_polls(questions=1, choices_per_question=options['choices'],
+                                  comments=options['comments'])
+        iterations = options['iterations']
+        question = Question.objects.get(pk=question_id)
+        #same template dirs and tag libraries as configured engine, only loaders differ
+        configured = engines['django'].engine
+        engine_options = {'dirs': configured.dirs, 'libraries': configured.libraries}
+        fragments = caches['fragments']
+        try:
+            contexts = {
+                'polls/detail.html': lambda: {'question': question, 'choices': question.choice_set.all(),
+                                              'csrf_token': 'benchmark'},
+                'polls/comments.html': lambda: {'question': question, 'sentiment': '', 'page': CommentsPage(
+                    question.comment_set.order_by('id'), 0, settings.POLLS_COMMENTS_PAGE_SIZE)},
+            }
+            cached_engine = Engine(loaders=[('django.template.loaders.cached.Loader', LOADERS)], **engine_options)
+            results = {}
+            for template_name, context in contexts.items():
+                results[template_name] = {
+                    'cold': self.measure(lambda: Engine(loaders=LOADERS, **engine_options), template_name,
+                                         context, fragments, iterations, warm=False),
+                    'cached_loader': self.measure(lambda: cached_engine, template_name,
+                                                  context, fragments, iterations, warm=False),
+                    'warm_fragments': self.measure(lambda: cached_engine, template_name,
+                                                   context, fragments, iterations, warm=True),
+                }
+            self.stdout.write(json.dumps(results, indent=2))
+        finally:
+            fragments.clear()
+            question.delete()
+
+    def measure(self, engine, template_name, context, fragments, iterations, warm):
+        """Renders template iterations times, clears fragment cache before every render unless warm"""
+        latencies = []
+        fragments.clear()
+        for _ in range(iterations):
+            if not warm:
+                fragments.clear()
+            started = time.perf_counter()
+            engine().get_template(template_name).render(Context(context()))
+            latencies.append(time.perf_counter() - started)
+        if warm:
+            #first render fills the cache
+            latencies = latencies[1:]
+        return summarize(latencies, sum(latencies))
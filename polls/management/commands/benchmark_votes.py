@@ -0,0 +1,81 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from polls.bench import run_concurrently, summarize
+from polls.models import Question
+from polls.shards import fold_shards, write_sharded_vote
+from polls.votes import VoteBuffer, write_vote
+
+class Command(BaseCommand):
+    help = (
+        "Compares vote throughput of row-lock UPDATE per vote with buffered "
+        "batched writes and with sharded counters of each given shard count "
+        "under concurrent writers. Creates scratch question in configured "
+        "database and deletes it afterwards"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['row', 'buffered', 'sharded', 'both', 'all'], default='both',
+                            help="'both' is row and buffered, 'all' adds sharded")
+        parser.add_argument('--writers', type=int, default=8, help="concurrent threads")
+        parser.add_argument('--votes', type=int, default=500, help="votes per writer")
+        parser.add_argument('--choices', type=int, default=2,
+                            help="choices to spread votes over, 1 means single hot row")
+        parser.add_argument('--flush-interval', type=float, default=0.5)
+        parser.add_argument('--flush-size', type=int, default=1000)
+        parser.add_argument('--shards', type=int, nargs='+', default=[1, 4, 16],
+                            help="shard counts of sharded mode")
+
+    def handle(self, *args, **options):
+        modes = {'both': ['row', 'buffered'], 'all': ['row', 'buffered', 'sharded']}.get(
+            options['mode'], [options['mode']])
+        results = {}
+        for mode in modes:
+            if mode == 'sharded':
+                for shards in options['shards']:
+                    results['sharded_{}'.format(shards)] = self.run_mode(mode, options, shards)
+            else:
+                results[mode] = self.run_mode(mode, options)
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def run_mode(self, mode, options, shards=None):
+        question = Question.objects.create(
+            question_text="benchmark_votes scratch question", pub_date=timezone.now())
+        choice_ids = [
+            question.choice_set.create(choice_text="choice {}".format(number)).pk
+            for number in range(options['choices'])
+        ]
+        try:
+            if mode == 'row':
+                def vote(worker, iteration):
+                    write_vote(question.pk, random.choice(choice_ids))
+                latencies, elapsed = run_concurrently(options['writers'], options['votes'], vote)
+            elif mode == 'sharded':
+                def vote(worker, iteration):
+                    write_sharded_vote(question.pk, random.choice(choice_ids), shards)
+                latencies, elapsed = run_concurrently(options['writers'], options['votes'], vote)
+                #votes only count once they are in votes columns
+                started = time.perf_counter()
+                while fold_shards():
+                    pass
+                elapsed += time.perf_counter() - started
+            else:
+                vote_buffer = VoteBuffer(options['flush_interval'], options['flush_size'])
+                vote_buffer.start()
+                def vote(worker, iteration):
+                    vote_buffer.add(question.pk, random.choice(choice_ids))
+                latencies, elapsed = run_concurrently(options['writers'], options['votes'], vote)
+                #votes only count once they are in database
+                started = time.perf_counter()
+                vote_buffer.stop()
+                elapsed += time.perf_counter() - started
+            question.refresh_from_db()
+            result = summarize(latencies, elapsed)
+            result['votes_in_database'] = question.total_votes
+            return result
+        finally:
+            question.delete()
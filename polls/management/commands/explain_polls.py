@@ -0,0 +1,93 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from polls.models import Question, Choice, ChoiceVoteShard, Comment, VoteBucket
+from polls.search import question_search_filter
+
+#strings that show up in query plan when primary key is used
+PRIMARY_KEY_MARKERS = ('INTEGER PRIMARY KEY', '_pkey')
+#strings that show up in query plan when rows are sorted instead of read in index order
+SORT_MARKERS = ('Sort Key', 'TEMP B-TREE')
+
+def hot_queries():
+    """
+    Returns (name, queryset, expected index markers) for queries of polls views
+    Any of the markers in query plan means query is served by index,
+    ordered queries also have to read rows in index order without sort
+    """
+    now = timezone.now()
+    queries = [
+        ('IndexView latest questions',
+         Question.objects.filter(pub_date__lte=now).order_by('-pub_date')[:5],
+         ('polls_question_pub_date_idx',)),
+        ('ResultsView question',
+         Question.objects.filter(pk=1, choice_count__gt=0),
+         PRIMARY_KEY_MARKERS),
+        ('ResultsView choices',
+         Choice.objects.filter(question_id=1),
+         ('polls_choice_question_id',)),
+        ('vote choice lookup',
+         Choice.objects.filter(question_id=1, pk=1),
+         ('polls_choice_question_id_idx',) + PRIMARY_KEY_MARKERS),
+        ('CommentsView question',
+         Question.objects.filter(pk=1, comment_count__gt=0),
+         PRIMARY_KEY_MARKERS),
+        ('CommentsView page',
+         Comment.objects.filter(question_id=1, id__gt=0).order_by('id')[:51],
+         ('polls_comment_q_id_idx',)),
+        ('CommentsView page by sentiment',
+         Comment.objects.filter(question_id=1, positive=True, id__gt=0).order_by('id')[:51],
+         ('polls_comment_q_pos_id_idx',)),
+        ('admin comment counters',
+         Comment.objects.filter(question_id=1, positive=False).values('question_id'),
+         ('polls_comment_q_pos_id_idx',)),
+        ('results trend buckets',
+         VoteBucket.objects.filter(question_id=1, resolution=VoteBucket.HOUR, start__gte=now).order_by('start'),
+         ('polls_bucket_q_res_start_idx',)),
+        ('sharded vote shard',
+         ChoiceVoteShard.objects.filter(choice_id=1, question_id=1, shard=0),
+         ('choicevoteshard_choice_id_shard', 'sqlite_autoindex_polls_choicevoteshard')),
+        ('sharded vote sums',
+         ChoiceVoteShard.objects.filter(question_id=1).order_by().values('choice').annotate(total=Sum('votes')),
+         ('polls_shard_q_choice_idx',)),
+    ]
+    search_filter = question_search_filter('poll', Question.objects.db)
+    if search_filter is not None:
+        queries.append(('admin question search',
+                        Question.objects.filter(search_filter),
+                        ('polls_question_search_idx', 'VIRTUAL TABLE')))
+    return queries
+
+class Command(BaseCommand):
+    help = "Prints query plans of polls hot paths and checks they use indexes (and don't sort)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help="print full plans")
+
+    def handle(self, *args, **options):
+        missing = []
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                #tiny tables are cheaper to scan, make planner show
+                #index it would use once tables grow
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            for name, queryset, markers in hot_queries():
+                plan = queryset.explain()
+                uses_index = any(marker in plan for marker in markers)
+                sorts = bool(queryset.query.order_by) and any(marker in plan for marker in SORT_MARKERS)
+                if not uses_index:
+                    status = "NO INDEX"
+                elif sorts:
+                    status = "NO INDEX ORDER"
+                else:
+                    status = "index"
+                if status != "index":
+                    missing.append(name)
+                self.stdout.write("{}: {}".format(name, status))
+                if options['verbose_plans'] or status != "index":
+                    self.stdout.write(plan)
+        if missing:
+            raise CommandError("Queries without index: {}".format(", ".join(missing)))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from polls.shards import fold_shards
+
+class Command(BaseCommand):
+    help = (
+        "Moves votes of sharded counters (POLLS_VOTE_SHARDS) into choice votes "
+        "and question total_votes columns. Run it periodically while sharding "
+        "is on, and once after turning it off"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="shards per transaction")
+
+    def handle(self, *args, **options):
+        folded = 0
+        while True:
+            batch = fold_shards(options['batch_size'])
+            if not batch:
+                break
+            folded += batch
+            if options['verbosity'] > 1:
+                self.stdout.write("{} votes folded".format(folded))
+        self.stdout.write(self.style.SUCCESS("Folded {} sharded vote(s)".format(folded)))
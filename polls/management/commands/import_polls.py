@@ -0,0 +1,189 @@
+import csv
+import io
+import itertools
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from polls.cache import invalidate_index
+from polls.models import Question, Choice, Comment, Checkpoint
+
+def read_jsonl(source):
+    """
+    Yields question records from JSON lines file, one question per line:
+    {"question_text": ..., "pub_date": ..., "choices": [{"choice_text": ..., "votes": 0}],
+     "comments": [{"comment_text": ..., "positive": true}]}
+    """
+    for line in source:
+        if line.strip():
+            yield json.loads(line)
+
+def read_csv(source):
+    """
+    Yields question records from CSV file with header
+    question_ref,question_text,pub_date,kind,text,value
+    Rows of one question follow each other and share question_ref.
+    kind is 'choice' (value is votes), 'comment' (value is 1/0 for positive/negative)
+    or empty for question without children
+    """
+    rows = csv.DictReader(source)
+    for _, question_rows in itertools.groupby(rows, key=lambda row: row['question_ref']):
+        record = None
+        for row in question_rows:
+            if record is None:
+                record = {
+                    'question_text': row['question_text'],
+                    'pub_date': row['pub_date'],
+                    'choices': [],
+                    'comments': [],
+                }
+            if row['kind'] == 'choice':
+                record['choices'].append({'choice_text': row['text'], 'votes': int(row['value'] or 0)})
+            elif row['kind'] == 'comment':
+                record['comments'].append({'comment_text': row['text'], 'positive': row['value'] != '0'})
+        yield record
+
+READERS = {'jsonl': read_jsonl, 'csv': read_csv}
+
+def parse_pub_date(value):
+    pub_date = parse_datetime(value)
+    if pub_date is None:
+        raise ValueError("Invalid pub_date {!r}".format(value))
+    if timezone.is_naive(pub_date):
+        pub_date = timezone.make_aware(pub_date)
+    return pub_date
+
+def copy_buffer(rows):
+    """
+    Returns rows as CSV file for COPY
+    Every value is quoted, COPY reads unquoted empty value as NULL
+    and empty comment_text would fail NOT NULL
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer, quoting=csv.QUOTE_ALL).writerows(rows)
+    buffer.seek(0)
+    return buffer
+
+def chunks(rows, size):
+    """Yields consecutive slices of rows with at most size rows"""
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+def copy_rows(model, columns, rows):
+    """Loads rows into model's table with PostgreSQL COPY"""
+    buffer = copy_buffer(rows)
+    sql = 'COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(
+        connection.ops.quote_name(model._meta.db_table),
+        ', '.join(connection.ops.quote_name(model._meta.get_field(column).column) for column in columns),
+    )
+    with connection.cursor() as cursor:
+        cursor.copy_expert(sql, buffer)
+
+class Command(BaseCommand):
+    help = (
+        "Imports questions with their choices and comments from JSONL or CSV file. "
+        "Rows are written in batches, one transaction per batch. Import can be "
+        "restarted after failure and continues after the last committed batch"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=sorted(READERS), help="default: file extension")
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help="rows (questions, choices and comments) per transaction and per "
+                                 "INSERT/COPY; question with more children is written by several "
+                                 "statements of one transaction, so it's never imported half")
+        parser.add_argument('--checkpoint', help="checkpoint name, default: absolute file path")
+        parser.add_argument('--no-copy', action='store_true',
+                            help="use bulk_create even on PostgreSQL")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(path)[1].lstrip('.')
+        if file_format not in READERS:
+            raise CommandError("Unknown format {!r}, use --format".format(file_format))
+        self.use_copy = connection.vendor == 'postgresql' and not options['no_copy']
+        self.batch_size = options['batch_size']
+        checkpoint_name = options['checkpoint'] or 'import_polls:{}'.format(os.path.abspath(path))[-255:]
+        checkpoint, _ = Checkpoint.objects.get_or_create(name=checkpoint_name)
+        if checkpoint.position:
+            self.stdout.write("Resuming after {} questions".format(checkpoint.position))
+
+        imported = 0
+        with open(path, newline='' if file_format == 'csv' else None, encoding='utf-8') as source:
+            records = itertools.islice(READERS[file_format](source), checkpoint.position, None)
+            batch, batch_rows = [], 0
+            for record in records:
+                batch.append(record)
+                batch_rows += 1 + len(record.get('choices', ())) + len(record.get('comments', ()))
+                if batch_rows >= options['batch_size']:
+                    imported += self.write_batch(batch, checkpoint)
+                    batch, batch_rows = [], 0
+            if batch:
+                imported += self.write_batch(batch, checkpoint)
+        #bulk inserts don't send signals
+        invalidate_index()
+        self.stdout.write(self.style.SUCCESS("Imported {} questions".format(imported)))
+
+    def write_batch(self, records, checkpoint):
+        """Saves records and moves checkpoint in one transaction"""
+        questions = []
+        for record in records:
+            choices = record.get('choices', [])
+            comments = record.get('comments', [])
+            positive_count = sum(1 for comment in comments if comment.get('positive', True))
+            #counters are known from the file, no need to recalculate them
+            questions.append(Question(
+                question_text=record['question_text'],
+                pub_date=parse_pub_date(record['pub_date']),
+                total_votes=sum(choice.get('votes', 0) for choice in choices),
+                choice_count=len(choices),
+                comment_count=len(comments),
+                positive_count=positive_count,
+                negative_count=len(comments) - positive_count,
+            ))
+
+        with transaction.atomic():
+            if connection.features.can_return_ids_from_bulk_insert:
+                Question.objects.bulk_create(questions)
+            else:
+                #backend can't tell ids of bulk inserted rows
+                for question in questions:
+                    question.save()
+
+            choice_rows = [
+                (question.pk, choice['choice_text'], choice.get('votes', 0))
+                for question, record in zip(questions, records)
+                for choice in record.get('choices', [])
+            ]
+            comment_rows = [
+                (question.pk, comment['comment_text'], comment.get('positive', True))
+                for question, record in zip(questions, records)
+                for comment in record.get('comments', [])
+            ]
+            #single question may have more children than batch_size
+            for rows in chunks(choice_rows, self.batch_size):
+                if self.use_copy:
+                    copy_rows(Choice, ('question', 'choice_text', 'votes'), rows)
+                else:
+                    Choice.objects.bulk_create(
+                        Choice(question_id=question_id, choice_text=text, votes=votes)
+                        for question_id, text, votes in rows)
+            for rows in chunks(comment_rows, self.batch_size):
+                if self.use_copy:
+                    copy_rows(Comment, ('question', 'comment_text', 'positive'), rows)
+                else:
+                    Comment.objects.bulk_create(
+                        Comment(question_id=question_id, comment_text=text, positive=positive)
+                        for question_id, text, positive in rows)
+
+            checkpoint.position += len(records)
+            checkpoint.save(update_fields=['position'])
+
+        self.stdout.write("{} questions, {} choices, {} comments".format(
+            len(questions), len(choice_rows), len(comment_rows)))
+        return len(questions)
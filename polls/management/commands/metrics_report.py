@@ -0,0 +1,58 @@
+import glob
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.bench import percentile
+
+class Command(BaseCommand):
+    help = (
+        "Aggregates per-request metrics logged by RequestMetricsMiddleware "
+        "into per-view latency percentiles, query counts and database time"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('logs', nargs='*',
+                            help="metrics log files, default: POLLS_METRICS_LOG and its rotated backups")
+        parser.add_argument('--json', action='store_true', help="print report as JSON")
+
+    def handle(self, *args, **options):
+        paths = options['logs']
+        if not paths:
+            if not settings.POLLS_METRICS_LOG:
+                raise CommandError("POLLS_METRICS_LOG isn't set, pass log files explicitly")
+            paths = sorted(glob.glob(settings.POLLS_METRICS_LOG + '*'))
+        routes = {}
+        for path in paths:
+            with open(path) as log:
+                for line in log:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    routes.setdefault(entry['view'], []).append(entry)
+
+        report = {view: self.aggregate(entries) for view, entries in sorted(routes.items())}
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write("{:<28} {:>8} {:>9} {:>9} {:>9} {:>8} {:>8} {:>6}".format(
+            'view', 'requests', 'p50 ms', 'p95 ms', 'p99 ms', 'db ms', 'queries', 'dups'))
+        for view, row in report.items():
+            self.stdout.write("{:<28} {:>8} {:>9} {:>9} {:>9} {:>8} {:>8} {:>6}".format(
+                view, row['requests'], row['p50_ms'], row['p95_ms'], row['p99_ms'],
+                row['avg_db_ms'], row['avg_queries'], row['duplicates']))
+
+    def aggregate(self, entries):
+        latencies = sorted(entry['total_ms'] for entry in entries)
+        return {
+            'requests': len(entries),
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'avg_db_ms': round(sum(entry['db_ms'] for entry in entries) / len(entries), 3),
+            'avg_queries': round(sum(entry['queries'] for entry in entries) / len(entries), 1),
+            'max_queries': max(entry['queries'] for entry in entries),
+            'duplicates': sum(entry['duplicates'] for entry in entries),
+        }
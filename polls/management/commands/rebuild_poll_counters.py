@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from polls.models import Question
+
+class Command(BaseCommand):
+    help = "Recalculates stored vote and comment counters of questions"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'question_ids', nargs='*', type=int,
+            help="Questions to recalculate, all questions if omitted",
+        )
+
+    def handle(self, *args, **options):
+        questions = Question.objects.all()
+        if options['question_ids']:
+            questions = questions.filter(pk__in=options['question_ids'])
+        updated = questions.rebuild_counters()
+        self.stdout.write(self.style.SUCCESS(
+            "Rebuilt counters of {} question(s)".format(updated)))
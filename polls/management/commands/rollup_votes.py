@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from polls.history import purge, rollup_batch, vote_history_settings
+
+class Command(BaseCommand):
+    help = (
+        "Rolls up vote events into per-minute and per-hour buckets and deletes "
+        "events and minute buckets past retention (POLLS_VOTE_HISTORY). "
+        "Run it periodically, e.g. every minute from cron"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-purge', action='store_true', help="only roll up, keep old rows")
+
+    def handle(self, *args, **options):
+        history = vote_history_settings()
+        rolled_up = 0
+        while True:
+            batch = rollup_batch(history['ROLLUP_BATCH_SIZE'], history['ROLLUP_LAG_SECONDS'])
+            if not batch:
+                break
+            rolled_up += batch
+            if options['verbosity'] > 1:
+                self.stdout.write("{} events rolled up".format(rolled_up))
+        self.stdout.write(self.style.SUCCESS("Rolled up {} vote event(s)".format(rolled_up)))
+        if not options['no_purge']:
+            events, buckets = purge()
+            self.stdout.write(self.style.SUCCESS(
+                "Deleted {} old event(s) and {} old minute bucket(s)".format(events, buckets)))
@@ -0,0 +1,137 @@
+"""polls middleware"""
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('polls.metrics')
+
+METRICS_DEFAULTS = {
+    #share of requests that are measured, 0.0 turns metrics off
+    #measured request pays for query capture and timing, raise it
+    #(up to 1.0) only while profiling
+    'SAMPLE_RATE': 0.01,
+    'SERVER_TIMING_HEADER': True,
+}
+
+def metrics_settings():
+    return {**METRICS_DEFAULTS, **getattr(settings, 'POLLS_METRICS', {})}
+
+#upper bounds of latency histogram buckets in milliseconds, last one catches the rest
+HISTOGRAM_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, float('inf'))
+
+class RouteHistogram:
+    """In-process per-view request counters and latency histogram"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, view_name, total_ms, db_ms, queries):
+        with self._lock:
+            route = self._routes.setdefault(view_name, {
+                'requests': 0, 'total_ms': 0.0, 'db_ms': 0.0, 'queries': 0,
+                'buckets': [0] * len(HISTOGRAM_BUCKETS_MS),
+            })
+            route['requests'] += 1
+            route['total_ms'] += total_ms
+            route['db_ms'] += db_ms
+            route['queries'] += queries
+            for number, bound in enumerate(HISTOGRAM_BUCKETS_MS):
+                if total_ms <= bound:
+                    route['buckets'][number] += 1
+                    break
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(route, buckets=list(route['buckets'])) for name, route in self._routes.items()}
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+route_histogram = RouteHistogram()
+
+class RequestMetrics:
+    """Collects queries of one request, used as database execute wrapper"""
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.statements = Counter()
+        self.render_seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.queries += 1
+            self.statements[(sql, repr(params))] += 1
+
+    @property
+    def duplicates(self):
+        """Amount of queries that repeat earlier query with same SQL and parameters"""
+        return sum(amount - 1 for amount in self.statements.values())
+
+class RequestMetricsMiddleware:
+    """
+    Measures query count, database time, duplicate queries and template
+    render time of sampled requests. Results go to Server-Timing header,
+    'polls.metrics' logger (one JSON object per request) and route_histogram
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        options = metrics_settings()
+        if random.random() >= options['SAMPLE_RATE']:
+            return self.get_response(request)
+
+        metrics = request._polls_metrics = RequestMetrics()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(metrics))
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - started) * 1000
+        db_ms = metrics.db_seconds * 1000
+        render_ms = metrics.render_seconds * 1000
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else 'unresolved'
+
+        if options['SERVER_TIMING_HEADER']:
+            response['Server-Timing'] = ', '.join([
+                'db;dur={:.2f};desc="{} queries, {} duplicate"'.format(
+                    db_ms, metrics.queries, metrics.duplicates),
+                'tpl;dur={:.2f}'.format(render_ms),
+                'total;dur={:.2f}'.format(total_ms),
+            ])
+        route_histogram.record(view_name, total_ms, db_ms, metrics.queries)
+        logger.info(json.dumps({
+            'view': view_name,
+            'method': request.method,
+            'status': response.status_code,
+            'total_ms': round(total_ms, 3),
+            'db_ms': round(db_ms, 3),
+            'render_ms': round(render_ms, 3),
+            'queries': metrics.queries,
+            'duplicates': metrics.duplicates,
+        }))
+        return response
+
+    def process_template_response(self, request, response):
+        """Times rendering of TemplateResponse returned by generic views"""
+        metrics = getattr(request, '_polls_metrics', None)
+        if metrics is not None:
+            render_started = time.perf_counter()
+
+            def rendered(response):
+                metrics.render_seconds += time.perf_counter() - render_started
+            response.add_post_render_callback(rendered)
+        return response
@@ -0,0 +1,118 @@
+# Generated by Django 2.2.28 on 2026-10-17 16:23
+#NOTE: squashed by hand from generated output, fields added by later
+#migrations are folded into CreateModel. Counter fill of 0004 is elided,
+#new database has no rows to fill
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def install_search(apps, schema_editor):
+    """tsvector columns with GIN indexes on PostgreSQL, FTS5 tables on SQLite"""
+    from polls.search import install_search
+    install_search(schema_editor.connection)
+
+
+def uninstall_search(apps, schema_editor):
+    from polls.search import uninstall_search
+    uninstall_search(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    replaces = [
+        ('polls', '0001_initial'),
+        ('polls', '0002_comment'),
+        ('polls', '0003_auto_20190704_1526'),
+        ('polls', '0004_question_counters'),
+        ('polls', '0005_hot_path_indexes'),
+        ('polls', '0006_checkpoint'),
+        ('polls', '0007_question_modified'),
+        ('polls', '0008_question_version'),
+        ('polls', '0009_search'),
+        ('polls', '0010_vote_history'),
+    ]
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Question',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('question_text', models.CharField(max_length=200)),
+                ('pub_date', models.DateTimeField(verbose_name='date published')),
+                ('total_votes', models.IntegerField(default=0, editable=False)),
+                ('choice_count', models.IntegerField(default=0, editable=False)),
+                ('comment_count', models.IntegerField(default=0, editable=False)),
+                ('positive_count', models.IntegerField(default=0, editable=False)),
+                ('negative_count', models.IntegerField(default=0, editable=False)),
+                ('modified', models.DateTimeField(auto_now=True)),
+                ('version', models.PositiveIntegerField(default=1, editable=False)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['pub_date'], name='polls_question_pub_date_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Choice',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('choice_text', models.CharField(max_length=200)),
+                ('votes', models.IntegerField(default=0)),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.Question')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['question', 'id'], name='polls_choice_question_id_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Comment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('comment_text', models.CharField(max_length=200)),
+                ('positive', models.BooleanField(default=True)),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.Question')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['question', 'positive', 'id'], name='polls_comment_q_pos_id_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Checkpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('position', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VoteEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('created', models.DateTimeField(db_index=True)),
+                ('count', models.PositiveIntegerField(default=1)),
+                ('choice', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='polls.Choice')),
+                ('question', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='polls.Question')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VoteBucket',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('resolution', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour')], max_length=6)),
+                ('start', models.DateTimeField()),
+                ('votes', models.BigIntegerField(default=0)),
+                ('choice', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='polls.Choice')),
+                ('question', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='polls.Question')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['question', 'resolution', 'start'], name='polls_bucket_q_res_start_idx')],
+                'unique_together': {('choice', 'resolution', 'start')},
+            },
+        ),
+        migrations.RunPython(install_search, uninstall_search),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 2.2.28 on 2026-10-17 16:02
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    """Calculates counters for existing questions"""
+    Question = apps.get_model('polls', 'Question')
+    Choice = apps.get_model('polls', 'Choice')
+    Comment = apps.get_model('polls', 'Comment')
+
+    def child_subquery(model, aggregate, **filters):
+        subquery = (model.objects
+                    .filter(question=OuterRef('pk'), **filters)
+                    .order_by()
+                    .values('question')
+                    .annotate(total=aggregate)
+                    .values('total'))
+        return Coalesce(Subquery(subquery, output_field=IntegerField()), 0)
+
+    Question.objects.update(
+        total_votes=child_subquery(Choice, Sum('votes')),
+        choice_count=child_subquery(Choice, Count('pk')),
+        comment_count=child_subquery(Comment, Count('pk')),
+        positive_count=child_subquery(Comment, Count('pk'), positive=True),
+        negative_count=child_subquery(Comment, Count('pk'), positive=False),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0003_auto_20190704_1526'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='choice_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='comment_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='negative_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='positive_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='total_votes',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        #only needed for rows that existed before, squashed migration skips it
+        migrations.RunPython(fill_counters, migrations.RunPython.noop, elidable=True),
+    ]
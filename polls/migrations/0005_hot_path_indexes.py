@@ -0,0 +1,25 @@
+# Generated by Django 2.2.28 on 2026-10-17 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0004_question_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='choice',
+            index=models.Index(fields=['question', 'id'], name='polls_choice_question_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['question', 'positive', 'id'], name='polls_comment_q_pos_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['pub_date'], name='polls_question_pub_date_idx'),
+        ),
+    ]
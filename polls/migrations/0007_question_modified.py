@@ -0,0 +1,20 @@
+# Generated by Django 2.2.28 on 2026-10-17 16:20
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0006_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='modified',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
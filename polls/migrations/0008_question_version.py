@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-17 16:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0007_question_modified'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
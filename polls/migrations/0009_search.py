@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+def install_search(apps, schema_editor):
+    """tsvector columns with GIN indexes on PostgreSQL, FTS5 tables on SQLite"""
+    from polls.search import install_search
+    install_search(schema_editor.connection)
+
+
+def uninstall_search(apps, schema_editor):
+    from polls.search import uninstall_search
+    uninstall_search(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0008_question_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search, uninstall_search),
+    ]
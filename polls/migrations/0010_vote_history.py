@@ -0,0 +1,43 @@
+# Generated by Django 2.2.28 on 2026-10-17 16:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0009_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('created', models.DateTimeField(db_index=True)),
+                ('count', models.PositiveIntegerField(default=1)),
+                ('choice', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='polls.Choice')),
+                ('question', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='polls.Question')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VoteBucket',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('resolution', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour')], max_length=6)),
+                ('start', models.DateTimeField()),
+                ('votes', models.BigIntegerField(default=0)),
+                ('choice', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='polls.Choice')),
+                ('question', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='polls.Question')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='votebucket',
+            index=models.Index(fields=['question', 'resolution', 'start'], name='polls_bucket_q_res_start_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='votebucket',
+            unique_together={('choice', 'resolution', 'start')},
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.28 on 2026-10-17 17:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0001_squashed_0010_vote_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChoiceVoteShard',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('votes', models.IntegerField(default=0)),
+                ('choice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.Choice')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.Question')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='choicevoteshard',
+            index=models.Index(fields=['question', 'choice'], name='polls_shard_q_choice_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='choicevoteshard',
+            unique_together={('choice', 'shard')},
+        ),
+    ]
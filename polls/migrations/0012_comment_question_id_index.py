@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-17 17:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0011_vote_shards'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['question', 'id'], name='polls_comment_q_id_idx'),
+        ),
+    ]
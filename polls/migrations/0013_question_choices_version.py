@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-17 17:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0012_comment_question_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='choices_version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
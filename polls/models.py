@@ -2,34 +2,94 @@
 import datetime
 
 from django.db import models
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
+class QuestionQuerySet(models.QuerySet):
+    """Question queries changing many questions at once"""
+    def rebuild_counters(self):
+        """
+        Recalculates stored vote and comment counters from choice and comment tables
+        Runs as a single UPDATE, returns amount of updated questions
+        """
+        def child_subquery(model, aggregate, **filters):
+            subquery = (model.objects
+                        .filter(question=OuterRef('pk'), **filters)
+                        .order_by()
+                        .values('question')
+                        .annotate(total=aggregate)
+                        .values('total'))
+            return Coalesce(Subquery(subquery, output_field=IntegerField()), 0)
+
+        return self.update(
+            modified=timezone.now(),
+            version=F('version') + 1,
+            total_votes=child_subquery(Choice, Sum('votes')),
+            choice_count=child_subquery(Choice, Count('pk')),
+            comment_count=child_subquery(Comment, Count('pk')),
+            positive_count=child_subquery(Comment, Count('pk'), positive=True),
+            negative_count=child_subquery(Comment, Count('pk'), positive=False),
+            #choices may have been edited or deleted
+            choices_version=F('choices_version') + 1,
+        )
+
 class Question(models.Model):
     """Contains question text and publishing date"""
     question_text = models.CharField(max_length=200)
     pub_date = models.DateTimeField('date published')
+    #denormalized counters, kept up to date by polls.signals, vote view and admin
+    #NOTE: can drift if rows are changed bypassing those paths
+    #use "manage.py rebuild_poll_counters" to recalculate them
+    total_votes = models.IntegerField(default=0, editable=False)
+    choice_count = models.IntegerField(default=0, editable=False)
+    comment_count = models.IntegerField(default=0, editable=False)
+    positive_count = models.IntegerField(default=0, editable=False)
+    negative_count = models.IntegerField(default=0, editable=False)
+    #last change of question or its results, used for Last-Modified/ETag
+    #bumped on save and by every counter update
+    modified = models.DateTimeField(auto_now=True)
+    #grows with every change of question, its choices, votes or comments
+    #pages of question use it as ETag, see polls.views.QuestionPageMixin
+    version = models.PositiveIntegerField(default=1, editable=False)
+    #grows only when choices are added or edited (not with votes),
+    #keys cached choice list of detail page
+    choices_version = models.PositiveIntegerField(default=1, editable=False)
+
+    objects = QuestionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            #every public page filters or sorts by pub_date
+            models.Index(fields=['pub_date'], name='polls_question_pub_date_idx'),
+        ]
 
     def __str__(self):
         return "{}".format(
             self.question_text)
 
+    def save(self, *args, **kwargs):
+        """Saves question, edit of existing question bumps version in database"""
+        update_fields = kwargs.get('update_fields')
+        bump = not self._state.adding and (update_fields is None or 'version' in update_fields)
+        if bump:
+            #incremented by database so concurrent votes aren't overwritten
+            self.version = F('version') + 1
+        super().save(*args, **kwargs)
+        if bump:
+            self.refresh_from_db(fields=['version'])
+
     def count_comments(self):
-        """
-        Returns amount of comments
-        """
-        return Question.objects.get(pk=self.pk).comment_set.all().count()
+        """Returns amount of comments from stored counter"""
+        return self.comment_count
 
     def count_comments_positive(self):
-        """
-        Returns amount of positive comments
-        """
-        return Question.objects.get(pk=self.pk).comment_set.filter(positive=True).count()
+        """Returns amount of positive comments from stored counter"""
+        return self.positive_count
 
     def count_comments_negative(self):
-        """
-        Returns amount of negative comments
-        """
-        return Question.objects.get(pk=self.pk).comment_set.filter(positive=False).count()
+        """Returns amount of negative comments from stored counter"""
+        return self.negative_count
 
     def was_published_recently(self):
         """Determins if question was published less than day ago"""
@@ -41,8 +101,11 @@ class Question(models.Model):
     was_published_recently.boolean = True
     was_published_recently.short_description = 'Published recently?'
     count_comments.short_description = "Comments"
+    count_comments.admin_order_field = 'comment_count'
     count_comments_positive.short_description = "Postive"
+    count_comments_positive.admin_order_field = 'positive_count'
     count_comments_negative.short_description = "Negative"
+    count_comments_negative.admin_order_field = 'negative_count'
 
 class Comment(models.Model):
     """Comments to question. Contains link to question, comment text and bool positive"""
@@ -50,6 +113,14 @@ class Comment(models.Model):
     comment_text = models.CharField(max_length=200)
     positive = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            #sentiment counters and keyset pages of comments page filtered by sentiment
+            models.Index(fields=['question', 'positive', 'id'], name='polls_comment_q_pos_id_idx'),
+            #keyset pages of unfiltered comments page, read in id order without sort
+            models.Index(fields=['question', 'id'], name='polls_comment_q_id_idx'),
+        ]
+
     def __str__(self):
         return "{}. {}: '{}'".format(
             "Positive" if self.positive else "Negative",
@@ -66,8 +137,86 @@ class Choice(models.Model):
     choice_text = models.CharField(max_length=200)
     votes = models.IntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            #choice_set.get(pk=...) in vote view
+            models.Index(fields=['question', 'id'], name='polls_choice_question_id_idx'),
+        ]
+
     def __str__(self):
         return "{0}, choice: '{1}', votes: {2}".format(
             self.question,
             self.choice_text,
             self.votes)
+
+class Checkpoint(models.Model):
+    """
+    Progress of resumable jobs (imports, rollups)
+    Saved in the same transaction as the work it describes
+    """
+    name = models.CharField(max_length=255, unique=True)
+    position = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return "{}: {}".format(self.name, self.position)
+
+#NOTE: vote history references choices without database constraint and
+#cascade, so deleting question or choice doesn't have to walk its history.
+#Rows of deleted choices stay behind, trend queries only read existing choices
+
+class VoteEvent(models.Model):
+    """
+    Append-only record of votes, see polls.history
+    count is more than 1 for votes written in batch by vote buffer
+    """
+    id = models.BigAutoField(primary_key=True)
+    question = models.ForeignKey(Question, on_delete=models.DO_NOTHING, db_constraint=False)
+    choice = models.ForeignKey(Choice, on_delete=models.DO_NOTHING, db_constraint=False)
+    created = models.DateTimeField(db_index=True)
+    count = models.PositiveIntegerField(default=1)
+
+    def __str__(self):
+        return "choice {}: {} at {}".format(self.choice_id, self.count, self.created)
+
+class VoteBucket(models.Model):
+    """Votes of choice within one minute or hour, made from VoteEvent rows by rollup"""
+    MINUTE = 'minute'
+    HOUR = 'hour'
+    RESOLUTIONS = [(MINUTE, 'Minute'), (HOUR, 'Hour')]
+
+    id = models.BigAutoField(primary_key=True)
+    question = models.ForeignKey(Question, on_delete=models.DO_NOTHING, db_constraint=False)
+    choice = models.ForeignKey(Choice, on_delete=models.DO_NOTHING, db_constraint=False)
+    resolution = models.CharField(max_length=6, choices=RESOLUTIONS)
+    start = models.DateTimeField()
+    votes = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = [('choice', 'resolution', 'start')]
+        indexes = [
+            #trend of question over time range
+            models.Index(fields=['question', 'resolution', 'start'], name='polls_bucket_q_res_start_idx'),
+        ]
+
+    def __str__(self):
+        return "choice {} {} {}: {}".format(self.choice_id, self.resolution, self.start, self.votes)
+
+class ChoiceVoteShard(models.Model):
+    """
+    One of vote counters of choice, see polls.shards
+    Choice's votes are its votes column plus sum of its shards
+    """
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
+    shard = models.PositiveSmallIntegerField()
+    votes = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [('choice', 'shard')]
+        indexes = [
+            #sums of question's choices on results page
+            models.Index(fields=['question', 'choice'], name='polls_shard_q_choice_idx'),
+        ]
+
+    def __str__(self):
+        return "choice {} shard {}: {}".format(self.choice_id, self.shard, self.votes)
@@ -0,0 +1,214 @@
+"""
+Full-text search of questions and comments
+
+PostgreSQL: search_vector tsvector columns filled by triggers, GIN indexes.
+SQLite: FTS5 external content tables kept in sync by triggers.
+Both are created by migration 0009_search, they are not model fields,
+so queries here are raw SQL. Other databases (or SQLite without FTS5)
+fall back to unindexed icontains.
+"""
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from .models import Question, Comment
+
+#(table, text column) of searchable tables
+SEARCH_TABLES = [
+    ('polls_question', 'question_text'),
+    ('polls_comment', 'comment_text'),
+]
+
+TS_CONFIG = 'pg_catalog.english'
+
+def _postgresql_install(cursor, table, column):
+    cursor.execute('ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector'.format(table=table))
+    cursor.execute("UPDATE {table} SET search_vector = to_tsvector('{config}', {column})".format(
+        table=table, column=column, config=TS_CONFIG))
+    cursor.execute('CREATE INDEX IF NOT EXISTS {table}_search_idx ON {table} USING GIN (search_vector)'.format(
+        table=table))
+    cursor.execute('DROP TRIGGER IF EXISTS {table}_search_update ON {table}'.format(table=table))
+    #"OF column" keeps counter updates of vote path from running the trigger
+    cursor.execute(
+        "CREATE TRIGGER {table}_search_update BEFORE INSERT OR UPDATE OF {column} ON {table} "
+        "FOR EACH ROW EXECUTE PROCEDURE tsvector_update_trigger(search_vector, '{config}', {column})".format(
+            table=table, column=column, config=TS_CONFIG))
+
+def _postgresql_uninstall(cursor, table, column):
+    cursor.execute('DROP TRIGGER IF EXISTS {table}_search_update ON {table}'.format(table=table))
+    cursor.execute('ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector'.format(table=table))
+
+def _sqlite_triggers(table, column):
+    fts = '{}_fts'.format(table)
+    delete = ("INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column});"
+              .format(fts=fts, column=column))
+    insert = 'INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column});'.format(fts=fts, column=column)
+    return {
+        '{}_insert'.format(fts): 'AFTER INSERT ON {} BEGIN {} END'.format(table, insert),
+        '{}_delete'.format(fts): 'AFTER DELETE ON {} BEGIN {} END'.format(table, delete),
+        '{}_update'.format(fts): 'AFTER UPDATE OF {} ON {} BEGIN {} {} END'.format(column, table, delete, insert),
+    }
+
+def _sqlite_install(cursor, table, column):
+    """Creates missing FTS table and triggers, rebuilds index if anything was missing"""
+    fts = '{}_fts'.format(table)
+    cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name LIKE %s",
+                   [fts + '%'])
+    existing = {name for name, in cursor.fetchall()}
+    triggers = _sqlite_triggers(table, column)
+    if existing >= {fts, *triggers}:
+        return False
+    cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({column}, content='{table}', "
+                   "content_rowid='id')".format(fts=fts, column=column, table=table))
+    for name, body in triggers.items():
+        cursor.execute('CREATE TRIGGER IF NOT EXISTS {} {}'.format(name, body))
+    cursor.execute("INSERT INTO {fts}({fts}) VALUES ('rebuild')".format(fts=fts))
+    return True
+
+def _sqlite_uninstall(cursor, table, column):
+    fts = '{}_fts'.format(table)
+    for name in _sqlite_triggers(table, column):
+        cursor.execute('DROP TRIGGER IF EXISTS {}'.format(name))
+    cursor.execute('DROP TABLE IF EXISTS {}'.format(fts))
+
+def _has_fts5(cursor):
+    cursor.execute('PRAGMA compile_options')
+    return ('ENABLE_FTS5',) in cursor.fetchall()
+
+def install_search(connection):
+    """Creates search columns, indexes and triggers, safe to run again"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for table, column in SEARCH_TABLES:
+                _postgresql_install(cursor, table, column)
+        elif connection.vendor == 'sqlite' and _has_fts5(cursor):
+            for table, column in SEARCH_TABLES:
+                _sqlite_install(cursor, table, column)
+
+def uninstall_search(connection):
+    with connection.cursor() as cursor:
+        for table, column in SEARCH_TABLES:
+            if connection.vendor == 'postgresql':
+                _postgresql_uninstall(cursor, table, column)
+            elif connection.vendor == 'sqlite':
+                _sqlite_uninstall(cursor, table, column)
+
+def restore_sqlite_triggers(sender, using, **kwargs):
+    """
+    post_migrate handler
+    SQLite migrations that alter a table copy it to new one and drop old one
+    together with its triggers, this puts them back and reindexes
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        tables = connection.introspection.table_names(cursor)
+        if not all('{}_fts'.format(table) in tables for table, _ in SEARCH_TABLES):
+            #not migrated yet or no FTS5
+            return
+        for table, column in SEARCH_TABLES:
+            _sqlite_install(cursor, table, column)
+
+def search_backend(connection):
+    """Returns 'postgresql', 'sqlite' (FTS5) or 'fallback'"""
+    if connection.vendor == 'postgresql':
+        return 'postgresql'
+    if connection.vendor == 'sqlite':
+        if not getattr(connection, '_polls_fts', False):
+            connection._polls_fts = 'polls_question_fts' in connection.introspection.table_names()
+        if connection._polls_fts:
+            return 'sqlite'
+    return 'fallback'
+
+def fts5_query(text):
+    """Quotes every word, so user input can't use FTS5 query syntax"""
+    return ' '.join('"{}"'.format(word.replace('"', '""')) for word in text.split())
+
+def _match_sql(backend, table):
+    """Returns SQL matching rows of table alias t against single parameter"""
+    if backend == 'postgresql':
+        return "t.search_vector @@ plainto_tsquery('{}', %s)".format(TS_CONFIG)
+    return 't.id IN (SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH %s)'.format(table=table)
+
+def _ranked_ids(connection, backend, table, text, join, filters, params, limit):
+    """Returns [(id, rank)] of best matching rows, highest rank first"""
+    if backend == 'postgresql':
+        sql = ("SELECT t.id, ts_rank(t.search_vector, query) AS rank "
+               "FROM {table} t {join}, plainto_tsquery('{config}', %s) query "
+               "WHERE t.search_vector @@ query {filters} "
+               "ORDER BY rank DESC, t.id DESC LIMIT %s").format(
+                   table=table, join=join, filters=filters, config=TS_CONFIG)
+    else:
+        #bm25 rank is negative, better match is lower
+        #NOTE: MATCH needs FTS table name, not an alias
+        sql = ("SELECT t.id, -{table}_fts.rank FROM {table}_fts JOIN {table} t ON t.id = {table}_fts.rowid {join} "
+               "WHERE {table}_fts MATCH %s {filters} "
+               "ORDER BY {table}_fts.rank, t.id DESC LIMIT %s").format(table=table, join=join, filters=filters)
+        text = fts5_query(text)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [text, *params, limit])
+        return cursor.fetchall()
+
+def _load_ranked(queryset, ranked):
+    """Returns objects of [(id, rank)] in rank order with rank attribute"""
+    objects = queryset.in_bulk([pk for pk, _ in ranked])
+    results = []
+    for pk, rank in ranked:
+        if pk in objects:
+            objects[pk].rank = rank
+            results.append(objects[pk])
+    return results
+
+def search_questions(text, limit=20):
+    """Returns best matching published questions, highest rank first"""
+    if not text.split():
+        return []
+    now = timezone.now()
+    connection = connections[Question.objects.db]
+    backend = search_backend(connection)
+    if backend == 'fallback':
+        questions = list(Question.objects
+                         .filter(question_text__icontains=text.strip(), pub_date__lte=now)
+                         .order_by('-pub_date')[:limit])
+        for question in questions:
+            question.rank = None
+        return questions
+    ranked = _ranked_ids(connection, backend, 'polls_question', text, '', 'AND t.pub_date <= %s',
+                         [connection.ops.adapt_datetimefield_value(now)], limit)
+    return _load_ranked(Question.objects.all(), ranked)
+
+def search_comments(text, limit=20):
+    """Returns best matching comments of published questions with their questions, highest rank first"""
+    if not text.split():
+        return []
+    now = timezone.now()
+    connection = connections[Comment.objects.db]
+    backend = search_backend(connection)
+    if backend == 'fallback':
+        comments = list(Comment.objects
+                        .filter(comment_text__icontains=text.strip(), question__pub_date__lte=now)
+                        .select_related('question')
+                        .order_by('-id')[:limit])
+        for comment in comments:
+            comment.rank = None
+        return comments
+    ranked = _ranked_ids(connection, backend, 'polls_comment', text,
+                         'JOIN polls_question q ON q.id = t.question_id', 'AND q.pub_date <= %s',
+                         [connection.ops.adapt_datetimefield_value(now)], limit)
+    return _load_ranked(Comment.objects.select_related('question'), ranked)
+
+def question_search_filter(text, using):
+    """
+    Returns Q matching questions by indexed search on database alias,
+    None if database has no search index
+    """
+    connection = connections[using]
+    backend = search_backend(connection)
+    if backend == 'fallback':
+        return None
+    if backend == 'sqlite':
+        text = fts5_query(text)
+    sql = 'SELECT t.id FROM polls_question t WHERE {}'.format(_match_sql(backend, 'polls_question'))
+    return Q(pk__in=RawSQL(sql, [text]))
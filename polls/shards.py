@@ -0,0 +1,118 @@
+"""
+Sharded vote counters
+
+With POLLS_VOTE_SHARDS['ENABLED'] a vote increments one of SHARDS counter
+rows of its choice, picked at random, instead of the choice row itself, so
+concurrent votes for a hot choice wait on different row locks. Question
+counters aren't touched per vote either.
+
+Choice's votes are its votes column plus sum of its shards. Results read
+the sums of question's shards in one query, cached for CACHE_SECONDS under
+question's version (fold bumps it, so cached sums are never counted twice).
+Live results read them uncached, every tick has to see the latest votes.
+"manage.py fold_vote_shards" moves shard sums into votes and total_votes
+columns. Run it periodically, and before turning sharding off.
+"""
+import random
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .expressions import sum_case
+from .history import record_events
+from .models import Question, Choice, ChoiceVoteShard
+
+VOTE_SHARDS_DEFAULTS = {
+    'ENABLED': False,
+    #counter rows per choice
+    'SHARDS': 8,
+    #seconds shard sums of question stay cached
+    #NOTE: voter may see own vote on results page only after this time
+    'CACHE_SECONDS': 2,
+}
+
+def vote_shards_settings():
+    return {**VOTE_SHARDS_DEFAULTS, **getattr(settings, 'POLLS_VOTE_SHARDS', {})}
+
+def _sums_cache_key(question_id, version):
+    return 'polls:shards:{}:{}'.format(question_id, version)
+
+def write_sharded_vote(question_id, choice_id, shards=None):
+    """
+    Adds single vote to random shard of choice
+    Missing shards are created by first vote, shard update doubles as check
+    that choice belongs to question.
+    Returns False if question has no such choice
+    """
+    shards = shards or vote_shards_settings()['SHARDS']
+    shard = random.randrange(shards)
+    with transaction.atomic():
+        updated = (ChoiceVoteShard.objects
+                   .filter(choice_id=choice_id, question_id=question_id, shard=shard)
+                   .update(votes=F('votes') + 1))
+        if not updated:
+            if not Choice.objects.filter(pk=choice_id, question_id=question_id).exists():
+                return False
+            ChoiceVoteShard.objects.bulk_create(
+                [ChoiceVoteShard(question_id=question_id, choice_id=choice_id, shard=number)
+                 for number in range(shards)],
+                ignore_conflicts=True)
+            ChoiceVoteShard.objects.filter(choice_id=choice_id, shard=shard).update(votes=F('votes') + 1)
+        record_events({(question_id, choice_id): 1})
+    return True
+
+def _read_sums(question_id):
+    return dict(ChoiceVoteShard.objects
+                .filter(question_id=question_id)
+                .order_by()
+                .values('choice')
+                .annotate(total=Sum('votes'))
+                .values_list('choice', 'total'))
+
+def sharded_votes(question_id, version=None):
+    """
+    Returns {choice_id: votes} of question's shards
+    Cached for CACHE_SECONDS if question's version is given, read from database otherwise
+    """
+    if version is None:
+        return _read_sums(question_id)
+    key = _sums_cache_key(question_id, version)
+    sums = cache.get(key)
+    if sums is None:
+        sums = _read_sums(question_id)
+        cache.set(key, sums, vote_shards_settings()['CACHE_SECONDS'])
+    return sums
+
+def fold_shards(batch_size=1000):
+    """
+    Moves votes of up to batch_size non-empty shards into choice votes and
+    question total_votes, returns amount of moved votes
+    Shards are locked until their votes are moved, so no vote is lost or counted twice.
+    Question version is bumped in the same transaction, so sums cached
+    before fold are no longer read.
+    """
+    with transaction.atomic():
+        shards = list(ChoiceVoteShard.objects
+                      .select_for_update()
+                      .filter(votes__gt=0)
+                      .order_by('pk')
+                      .values_list('pk', 'question_id', 'choice_id', 'votes')[:batch_size])
+        if not shards:
+            return 0
+        choice_deltas = Counter()
+        question_deltas = Counter()
+        for _, question_id, choice_id, votes in shards:
+            choice_deltas[choice_id] += votes
+            question_deltas[question_id] += votes
+        ChoiceVoteShard.objects.filter(pk__in=[pk for pk, _, _, _ in shards]).update(votes=0)
+        Choice.objects.filter(pk__in=choice_deltas).update(
+            votes=F('votes') + sum_case(choice_deltas))
+        Question.objects.filter(pk__in=question_deltas).update(
+            total_votes=F('total_votes') + sum_case(question_deltas),
+            modified=timezone.now(),
+            version=F('version') + 1)
+    return sum(question_deltas.values())
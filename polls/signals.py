@@ -0,0 +1,50 @@
+"""polls signal handlers"""
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import invalidate_index
+from .models import Question, Choice, Comment
+
+def _bump_counters(child, **deltas):
+    """
+    Adds deltas to counters of child's question in database
+    and in question instance cached on child (if any) so it doesn't go stale
+    """
+    Question.objects.filter(pk=child.question_id).update(
+        modified=timezone.now(),
+        version=F('version') + 1,
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+    question = child._meta.get_field('question').get_cached_value(child, default=None)
+    if question is not None:
+        for field, delta in deltas.items():
+            setattr(question, field, getattr(question, field) + delta)
+        question.version += 1
+
+#NOTE: only creation is tracked here. Edits and deletes made in admin
+#recalculate counters in QuestionAdmin.save_related, other paths
+#are covered by "manage.py rebuild_poll_counters".
+#post_delete receivers would also make every cascade delete of a question
+#load and signal each of its comments
+@receiver(post_save, sender=Choice)
+def count_new_choice(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        _bump_counters(instance, choice_count=1, total_votes=instance.votes, choices_version=1)
+    else:
+        #edited text drops cached choice list of detail page
+        _bump_counters(instance, choices_version=1)
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        sentiment_counter = 'positive_count' if instance.positive else 'negative_count'
+        _bump_counters(instance, comment_count=1, **{sentiment_counter: 1})
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def reset_index_cache(sender, **kwargs):
+    invalidate_index()
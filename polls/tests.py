@@ -1,9 +1,28 @@
 import datetime
+import json
+import os
+import tempfile
+import threading
+from io import StringIO
 
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from django.urls import reverse
-from .models import Question
+from . import comments, history, shards, throttle, votes
+from .admin import EstimatedCountPaginator, estimated_count
+from .bench import compare_results, parse_importtime, seed_polls, summarize_imports
+from .cache import index_cache_timeout
+from .live import ResultsHub
+from .management.commands import import_polls
+from .middleware import RequestMetrics, route_histogram
+from .models import Comment, Question, VoteBucket, VoteEvent
+from .search import restore_sqlite_triggers, search_backend, search_comments, search_questions
 
 #NOTE: Why write test
 #Tests save you time
@@ -14,8 +33,11 @@ from .models import Question
 
 #also test-driven development is a valid development strategy (see koans)
 
-#NOTE: for tests to work USER from DATABASES settings.py must have
+#NOTE: "manage.py test" runs on in-memory SQLite (officialTutorial/test_settings.py)
+#with --settings=officialTutorial.settings USER from DATABASES must have
 #permission to create databases
+#fixtures shared by all tests of a class go to setUpTestData,
+#they are created once and rolled back after the class
 def create_question(question_text, days):
     """
     Create a question with given text, and offset in 'days' days
@@ -252,8 +274,24 @@ class QuestionModelTests(TestCase):
 
         #TODO test negative comments: no comments, positive and negative, one of a kind, two of a kind
 
+    def test_count_comments_reads_counters(self):
+        """
+        count_comments() and friends read stored counters without queries
+        """
+        question_with_comments = create_question(question_text="Question with responce", days=1)
+        question_with_comments.comment_set.create(comment_text='', positive=True)
+        question = Question.objects.get(pk=question_with_comments.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(question.count_comments(), 1)
+            self.assertEqual(question.count_comments_positive(), 1)
+            self.assertEqual(question.count_comments_negative(), 0)
+
 class QuestionIndexViewTests(TestCase):
     """Tests for question index view"""
+    def setUp(self):
+        #index is cached and cache isn't rolled back between tests
+        cache.clear()
+
     def test_no_question(self):
         """
         If no question exist, message is displayed.
@@ -307,6 +345,33 @@ class QuestionIndexViewTests(TestCase):
             ['<Question: Past question>']
         )
 
+    def test_index_is_cached(self):
+        """
+        Second request to index page doesn't query database
+        """
+        create_question(question_text="Past question", days=-30)
+        self.client.get(reverse('polls:index'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('polls:index'))
+        self.assertContains(response, "Past question")
+
+    def test_index_cache_is_reset_on_question_save(self):
+        """
+        New question shows up on index page right away
+        """
+        self.client.get(reverse('polls:index'))
+        create_question(question_text="Past question", days=-30)
+        response = self.client.get(reverse('polls:index'))
+        self.assertContains(response, "Past question")
+
+    def test_index_cache_expires_when_future_question_is_published(self):
+        """
+        Index cache timeout ends when next future question gets published
+        """
+        now = timezone.now()
+        Question.objects.create(question_text="Future question", pub_date=now + datetime.timedelta(seconds=30))
+        self.assertEqual(index_cache_timeout(now), 30)
+
 class QuestionDetailViewTests(TestCase):
     def test_future_question(self):
         """
@@ -325,6 +390,21 @@ class QuestionDetailViewTests(TestCase):
         response = self.client.get(reverse("polls:detail", args=(past_question.id,)))
         self.assertEqual(response.status_code, 200)
 
+    def test_query_count_doesnt_grow_with_choices_and_comments(self):
+        """
+        Detail page takes 2 queries (question and choices) for
+        any amount of choices and comments
+        """
+        question = create_question(question_text="Past question", days=-5)
+        for amount in (1, 20):
+            while question.choice_set.count() < amount:
+                question.choice_set.create(choice_text='Choice')
+                question.comment_set.create(comment_text='Comment')
+            with self.assertNumQueries(2):
+                response = self.client.get(reverse("polls:detail", args=(question.id,)))
+            self.assertEqual(len(response.context['choices']), amount)
+            self.assertContains(response, 'Watch comments')
+
 class QuestionChoiceViewTests(TestCase):
     def test_result_page_displays_questions_with_choices(self):
         """
@@ -359,4 +439,1129 @@ class QuestionCommentsViewTests(TestCase):
         """
         question_with_comments = create_question(question_text="Question without responce", days=1)
         response = self.client.get(reverse("polls:results", args=(question_with_comments.id,)))
-        self.assertEqual(response.status_code, 404)
\ No newline at end of file
+        self.assertEqual(response.status_code, 404)
+
+class CommentsPaginationTests(TestCase):
+    """Tests for comments page and comments export"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.question = create_question(question_text="Question", days=-1)
+        for number in range(5):
+            cls.question.comment_set.create(comment_text='Comment {}'.format(number), positive=number % 2 == 0)
+
+    @override_settings(POLLS_COMMENTS_PAGE_SIZE=2)
+    def test_pages_follow_cursor(self):
+        """
+        Comments page shows page_size comments and link to next page by last comment id
+        """
+        url = reverse('polls:comments', args=(self.question.id,))
+        response = self.client.get(url)
+        first_page = response.context['page'].comments
+        self.assertEqual([comment.comment_text for comment in first_page], ['Comment 0', 'Comment 1'])
+        self.assertEqual(response.context['page'].next_cursor, first_page[-1].id)
+        response = self.client.get(url, {'after': response.context['page'].next_cursor})
+        self.assertEqual(
+            [comment.comment_text for comment in response.context['page'].comments],
+            ['Comment 2', 'Comment 3']
+        )
+        response = self.client.get(url, {'after': response.context['page'].next_cursor})
+        self.assertEqual([comment.comment_text for comment in response.context['page'].comments], ['Comment 4'])
+        self.assertIs(response.context['page'].has_next, False)
+
+    def test_sentiment_filter(self):
+        """
+        sentiment=negative shows only negative comments
+        """
+        response = self.client.get(
+            reverse('polls:comments', args=(self.question.id,)), {'sentiment': 'negative'})
+        self.assertEqual(
+            [comment.comment_text for comment in response.context['page'].comments],
+            ['Comment 1', 'Comment 3']
+        )
+
+    def test_export_streams_csv(self):
+        """
+        Export streams all comments as CSV rows
+        """
+        response = self.client.get(
+            reverse('polls:export_comments', args=(self.question.id,)), {'sentiment': 'positive'})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,positive,comment_text')
+        self.assertEqual([line.split(',')[2] for line in lines[1:]], ['Comment 0', 'Comment 2', 'Comment 4'])
+
+class LiveResultsTests(TestCase):
+    """Tests for live results hub and stream"""
+    def test_hub_publishes_only_changed_choices(self):
+        """
+        Watcher gets choices whose votes changed since previous tick
+        """
+        tallies = {1: {10: 0, 11: 0}}
+        fetched = []
+        def fetch(question_ids):
+            fetched.append(set(question_ids))
+            return {question_id: dict(tallies[question_id]) for question_id in question_ids}
+        hub = ResultsHub(fetch=fetch)
+        updates = hub.subscribe(1)
+        hub.notify(1)
+        hub.publish()
+        self.assertEqual(updates.get_nowait(), {10: 0, 11: 0})
+        tallies[1][11] = 3
+        hub.notify(1)
+        hub.notify(1)
+        hub.publish()
+        self.assertEqual(updates.get_nowait(), {11: 3})
+        #notifications within one tick are fetched once
+        self.assertEqual(fetched, [{1}, {1}])
+
+    def test_hub_ignores_questions_without_watchers(self):
+        """
+        Votes for questions nobody watches don't cause queries
+        """
+        hub = ResultsHub(fetch=lambda question_ids: self.fail("fetched without watchers"))
+        hub.notify(1)
+        self.assertEqual(hub.publish(), 0)
+
+    @override_settings(POLLS_LIVE_RESULTS={'ENABLED': True})
+    def test_stream_starts_with_all_tallies(self):
+        """
+        Stream first sends all choices with their votes
+        """
+        question = create_question(question_text="Question", days=-1)
+        choice = question.choice_set.create(choice_text='Yes', votes=2)
+        response = self.client.get(reverse('polls:results_stream', args=(question.id,)))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = iter(response.streaming_content)
+        next(events)
+        self.assertEqual(next(events).decode(),
+                         'event: tallies\ndata: {{"{}": 2}}\n\n'.format(choice.id))
+        response.close()
+
+    def test_live_results_off_by_default(self):
+        """
+        Results page has no stream script and stream answers 404 unless live results are on
+        """
+        question = create_question(question_text="Question", days=-1)
+        question.choice_set.create(choice_text='Yes')
+        response = self.client.get(reverse('polls:results', args=(question.id,)))
+        self.assertNotContains(response, 'EventSource')
+        response = self.client.get(reverse('polls:results_stream', args=(question.id,)))
+        self.assertEqual(response.status_code, 404)
+
+class ResultsExportTests(TestCase):
+    """Tests for results JSON and export endpoints"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.question = create_question(question_text="Question", days=-1)
+        cls.question.choice_set.create(choice_text='Yes', votes=2)
+        cls.question.choice_set.create(choice_text='No', votes=1)
+
+    def test_results_json(self):
+        """
+        results.json returns choices with votes
+        """
+        response = self.client.get(reverse('polls:results_json', args=(self.question.id,)))
+        data = response.json()
+        self.assertEqual(data['total_votes'], 3)
+        self.assertEqual([(choice['choice_text'], choice['votes']) for choice in data['choices']],
+                         [('Yes', 2), ('No', 1)])
+
+    def test_results_json_not_modified(self):
+        """
+        Request with current ETag gets 304 reading only question row
+        """
+        url = reverse('polls:results_json', args=(self.question.id,))
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_results_json_etag_changes_after_vote(self):
+        """
+        Vote changes ETag, so old one gets full response
+        """
+        url = reverse('polls:results_json', args=(self.question.id,))
+        etag = self.client.get(url)['ETag']
+        choice = self.question.choice_set.first()
+        self.client.post(reverse('polls:vote', args=(self.question.id,)), {'choice': choice.id})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_votes'], 4)
+
+    def test_export_ndjson_and_csv(self):
+        """
+        Export streams one JSON line per question or one CSV line per choice
+        """
+        create_question(question_text="Future question", days=5).choice_set.create(choice_text='Later')
+        response = self.client.get(reverse('polls:export_results'))
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(len(json.loads(lines[0])['choices']), 2)
+        response = self.client.get(reverse('polls:export_results'), {'format': 'csv'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[1:], [
+            '{},Question,{},Yes,2'.format(self.question.id, self.question.choice_set.get(choice_text='Yes').id),
+            '{},Question,{},No,1'.format(self.question.id, self.question.choice_set.get(choice_text='No').id),
+        ])
+
+class ConditionalPageTests(TestCase):
+    """Tests for ETag and Cache-Control of detail, results and comments pages"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.question = create_question(question_text="Question", days=-1)
+        cls.choice = cls.question.choice_set.create(choice_text='Yes')
+        cls.question.comment_set.create(comment_text='Comment', positive=True)
+
+    def test_unchanged_pages_are_not_modified(self):
+        """
+        Request with current ETag gets 304 after reading only question row
+        """
+        #first visit of detail page sets CSRF cookie, which is part of its ETag
+        self.client.get(reverse('polls:detail', args=(self.question.id,)))
+        for name in ('polls:detail', 'polls:results', 'polls:comments'):
+            url = reverse(name, args=(self.question.id,))
+            etag = self.client.get(url)['ETag']
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, name)
+
+    def test_vote_changes_etag(self):
+        """
+        Vote bumps question version, old ETag gets new page
+        """
+        url = reverse('polls:results', args=(self.question.id,))
+        etag = self.client.get(url)['ETag']
+        self.client.post(reverse('polls:vote', args=(self.question.id,)), {'choice': self.choice.id})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['choices'][0].votes, 1)
+
+    def test_comment_and_edit_change_etag(self):
+        """
+        New comment and saved edit both bump version
+        """
+        version = Question.objects.get(pk=self.question.pk).version
+        self.client.post(reverse('polls:leave_comment', args=(self.question.id,)),
+                         {'comment_text': 'Another', 'is_positive': 'False'})
+        question = Question.objects.get(pk=self.question.pk)
+        self.assertEqual(question.version, version + 1)
+        question.question_text = "Edited"
+        question.save()
+        self.assertEqual(question.version, version + 2)
+        self.assertEqual(Question.objects.get(pk=self.question.pk).version, version + 2)
+
+    def test_cache_control(self):
+        """
+        Detail page with CSRF token is private, results and comments may be shared
+        """
+        detail = self.client.get(reverse('polls:detail', args=(self.question.id,)))
+        self.assertIn('private', detail['Cache-Control'])
+        results = self.client.get(reverse('polls:results', args=(self.question.id,)))
+        self.assertIn('public', results['Cache-Control'])
+        self.assertIn('s-maxage', results['Cache-Control'])
+
+    def test_missing_question_isnt_cached(self):
+        response = self.client.get(reverse('polls:results', args=(self.question.id + 1,)))
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('Cache-Control', response)
+
+class SearchTests(TestCase):
+    """Tests for full-text search of questions and comments"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.pizza = create_question(question_text="Best pizza topping?", days=-1)
+        cls.pasta = create_question(question_text="Pizza or pasta, pizza or salad?", days=-2)
+        cls.future = create_question(question_text="Future pizza poll", days=5)
+        cls.pasta.comment_set.create(comment_text="Pasta with pizza cheese", positive=True)
+        cls.future.comment_set.create(comment_text="Pizza from the future", positive=False)
+
+    def test_questions_are_ranked(self):
+        """
+        Published questions are matched by word, better match comes first
+        """
+        results = search_questions("pizza")
+        self.assertEqual(results, [self.pasta, self.pizza])
+        self.assertIsNotNone(results[0].rank)
+        self.assertEqual(search_questions("pasta salad"), [self.pasta])
+        self.assertEqual(search_questions("   "), [])
+
+    def test_index_follows_edits_and_deletes(self):
+        """
+        Search index is kept in sync by database triggers
+        """
+        #class fixtures are shared by tests, edit copies
+        pizza = Question.objects.get(pk=self.pizza.pk)
+        pizza.question_text = "Best burger?"
+        pizza.save()
+        self.assertEqual(search_questions("burger"), [self.pizza])
+        self.assertEqual(search_questions("pizza"), [self.pasta])
+        Question.objects.get(pk=self.pasta.pk).delete()
+        self.assertEqual(search_questions("pizza"), [])
+
+    def test_comments_of_published_questions(self):
+        comments = search_comments("pizza")
+        self.assertEqual([comment.comment_text for comment in comments], ["Pasta with pizza cheese"])
+
+    def test_query_syntax_is_escaped(self):
+        """
+        Quotes and operators in user input don't break search
+        """
+        self.assertEqual(search_questions('pizza" OR NOT *'), [])
+
+    def test_search_view(self):
+        response = self.client.get(reverse('polls:search'), {'q': 'cheese'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([comment.comment_text for comment in response.context['comments']],
+                         ["Pasta with pizza cheese"])
+        self.assertEqual(response.context['questions'], [])
+
+    def test_admin_search_uses_index(self):
+        """
+        Admin changelist search finds questions through search index
+        """
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:polls_question_changelist'), {'q': 'topping'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.pizza])
+        if search_backend(connection) != 'fallback':
+            self.assertFalse(any('LIKE' in query['sql'] for query in queries.captured_queries))
+
+    def test_sqlite_triggers_are_restored(self):
+        """
+        Triggers dropped by SQLite table rebuild are put back after migrate
+        """
+        if search_backend(connection) != 'sqlite':
+            self.skipTest("SQLite FTS5 only")
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER polls_question_fts_insert')
+        restore_sqlite_triggers(sender=None, using='default')
+        create_question(question_text="Pizza again", days=-1)
+        self.assertEqual(len(search_questions("pizza")), 3)
+
+class VoteHistoryTests(TestCase):
+    """Tests for vote events, rollups and trend queries"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.question = create_question(question_text="Question", days=-1)
+        cls.yes = cls.question.choice_set.create(choice_text='Yes')
+        cls.no = cls.question.choice_set.create(choice_text='No')
+        cls.hour = timezone.now().replace(minute=0, second=0, microsecond=0) - datetime.timedelta(hours=3)
+
+    def add_events(self, choice, *minutes, count=1):
+        VoteEvent.objects.bulk_create(
+            VoteEvent(question=self.question, choice=choice, count=count,
+                      created=self.hour + datetime.timedelta(minutes=minute, seconds=5))
+            for minute in minutes
+        )
+
+    def test_vote_appends_event(self):
+        self.client.post(reverse('polls:vote', args=(self.question.id,)), {'choice': self.yes.id})
+        event = VoteEvent.objects.get()
+        self.assertEqual((event.choice_id, event.count), (self.yes.id, 1))
+
+    @override_settings(POLLS_VOTE_HISTORY={'ENABLED': False})
+    def test_disabled_history_records_nothing(self):
+        self.client.post(reverse('polls:vote', args=(self.question.id,)), {'choice': self.yes.id})
+        self.assertFalse(VoteEvent.objects.exists())
+
+    def test_rollup_makes_minute_and_hour_buckets(self):
+        """
+        Events are summed per choice into minute and hour buckets
+        """
+        self.add_events(self.yes, 0, 0, 1)
+        self.add_events(self.no, 1, count=4)
+        self.assertEqual(history.rollup_batch(100), 4)
+        minutes = history.vote_trend(self.question.id, VoteBucket.MINUTE, since=self.hour)
+        self.assertEqual(minutes, [
+            (self.hour, {self.yes.id: 2}),
+            (self.hour + datetime.timedelta(minutes=1), {self.yes.id: 1, self.no.id: 4}),
+        ])
+        self.assertEqual(history.vote_trend(self.question.id, since=self.hour),
+                         [(self.hour, {self.yes.id: 3, self.no.id: 4})])
+
+    def test_rollup_continues_from_checkpoint(self):
+        """
+        Next rollup adds only new events to existing buckets
+        """
+        self.add_events(self.yes, 0, 1, 2)
+        self.assertEqual(history.rollup_batch(2), 2)
+        self.assertEqual(history.rollup_batch(2), 1)
+        self.assertEqual(history.rollup_batch(2), 0)
+        self.add_events(self.yes, 2)
+        history.rollup_batch(100)
+        self.assertEqual(history.vote_trend(self.question.id, since=self.hour),
+                         [(self.hour, {self.yes.id: 4})])
+
+    def test_recent_events_wait_for_next_rollup(self):
+        """
+        Events younger than lag are left, their transaction may not be committed yet
+        """
+        self.add_events(self.yes, 0, 5)
+        now = self.hour + datetime.timedelta(minutes=6)
+        self.assertEqual(history.rollup_batch(100, lag_seconds=60, now=now), 1)
+
+    @override_settings(POLLS_VOTE_HISTORY={'RAW_RETENTION_DAYS': 0, 'MINUTE_RETENTION_DAYS': 0})
+    def test_purge_deletes_only_rolled_up_events(self):
+        self.add_events(self.yes, 0)
+        history.rollup_batch(100)
+        self.add_events(self.yes, 1)
+        self.assertEqual(history.purge(), (1, 1))
+        self.assertEqual(VoteEvent.objects.count(), 1)
+        self.assertEqual(VoteBucket.objects.filter(resolution=VoteBucket.HOUR).count(), 1)
+
+    def test_trend_endpoint(self):
+        self.add_events(self.yes, 0, 1)
+        call_command('rollup_votes', stdout=StringIO())
+        response = self.client.get(reverse('polls:results_trend', args=(self.question.id,)))
+        data = response.json()
+        self.assertEqual(data['resolution'], 'hour')
+        self.assertEqual([choice['choice_text'] for choice in data['choices']], ['Yes', 'No'])
+        self.assertEqual(data['buckets'][0]['votes'], {str(self.yes.id): 2})
+
+class BenchmarkTests(TestCase):
+    def test_compare_results_flags_regressions(self):
+        """
+        compare_results() flags latency growth over tolerance and extra queries
+        """
+        route = {'p50_ms': 1.0, 'p95_ms': 2.0, 'p99_ms': 3.0, 'rps': 100.0, 'queries': 2}
+        baseline = {'routes': {'detail': route}}
+        current = {'routes': {'detail': dict(route, p95_ms=2.1, p99_ms=4.0, queries=3)}}
+        regressed = [metric for _, metric, _, _, regressed in compare_results(baseline, current, 0.1) if regressed]
+        self.assertEqual(regressed, ['p99_ms', 'queries'])
+
+    def test_seed_polls(self):
+        """
+        seed_polls() creates questions with choices and comments and fills counters
+        """
+        question_ids = seed_polls(questions=3, choices_per_question=2, comments=7, batch_size=2)
+        self.assertEqual(len(question_ids), 3)
+        question = Question.objects.get(pk=question_ids[0])
+        self.assertEqual((question.choice_count, question.comment_count), (2, 3))
+
+    def test_parse_importtime(self):
+        """
+        -X importtime output is parsed with nesting, total counts top level imports only
+        """
+        output = "\n".join([
+            "import time: self [us] | cumulative | imported package",
+            "import time:       100 |        100 |     django.utils",
+            "import time:       300 |        400 |   django",
+            "import time:       500 |        900 | polls",
+            "import time:        50 |         50 | json",
+        ])
+        entries = parse_importtime(output)
+        self.assertEqual(entries[0], ('django.utils', 100, 100, 2))
+        self.assertEqual(entries[2], ('polls', 500, 900, 0))
+        summary = summarize_imports(entries, top=1)
+        self.assertEqual(summary['total_ms'], 0.95)
+        self.assertEqual(summary['slowest'], [{'module': 'polls', 'cumulative_ms': 0.9}])
+
+@override_settings(ROOT_URLCONF='officialTutorial.public_urls')
+class PublicProfileTests(TestCase):
+    """Tests for URLs of lean public worker profile"""
+    def test_polls_without_admin(self):
+        question = create_question(question_text="Question", days=-1)
+        self.assertEqual(self.client.get(reverse('polls:detail', args=(question.id,))).status_code, 200)
+        self.assertEqual(self.client.get('/admin/').status_code, 404)
+
+@override_settings(POLLS_METRICS={'SAMPLE_RATE': 1.0})
+class RequestMetricsTests(TestCase):
+    """Tests for request metrics middleware"""
+    def setUp(self):
+        route_histogram.reset()
+
+    def test_server_timing_header(self):
+        """
+        Measured response tells query count and timings in Server-Timing header
+        """
+        question = create_question(question_text="Past question", days=-5)
+        question.choice_set.create(choice_text='Choice')
+        response = self.client.get(reverse("polls:detail", args=(question.id,)))
+        server_timing = response['Server-Timing']
+        self.assertIn('db;dur=', server_timing)
+        self.assertIn('"2 queries, 0 duplicate"', server_timing)
+        self.assertIn('tpl;dur=', server_timing)
+        self.assertEqual(route_histogram.snapshot()['polls:detail']['requests'], 1)
+
+    @override_settings(POLLS_METRICS={'SAMPLE_RATE': 0.0})
+    def test_not_sampled_request_isnt_measured(self):
+        """
+        With sample rate 0 requests get no header and aren't counted
+        """
+        response = self.client.get(reverse("polls:index"))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(route_histogram.snapshot(), {})
+
+    def test_duplicate_queries_are_detected(self):
+        """
+        Same query with same parameters counts as duplicate
+        """
+        metrics = RequestMetrics()
+        with connection.execute_wrapper(metrics):
+            list(Question.objects.filter(pk=1))
+            list(Question.objects.filter(pk=1))
+            list(Question.objects.filter(pk=2))
+        self.assertEqual((metrics.queries, metrics.duplicates), (3, 1))
+
+    def test_metrics_report_aggregates_log(self):
+        """
+        metrics_report groups logged requests by view
+        """
+        log = tempfile.NamedTemporaryFile('w', suffix='.log', delete=False)
+        self.addCleanup(os.remove, log.name)
+        with log:
+            for total_ms in (10, 20, 30):
+                log.write(json.dumps({'view': 'polls:detail', 'total_ms': total_ms, 'db_ms': 1.0,
+                                      'queries': 2, 'duplicates': 0}) + '\n')
+        out = StringIO()
+        call_command('metrics_report', log.name, json=True, stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['polls:detail']['requests'], 3)
+        self.assertEqual(report['polls:detail']['p50_ms'], 20)
+
+class ImportPollsTests(TestCase):
+    """Tests for import_polls command"""
+    def write_file(self, suffix, content):
+        source = tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False)
+        self.addCleanup(os.remove, source.name)
+        with source:
+            source.write(content)
+        return source.name
+
+    def test_import_jsonl(self):
+        """
+        Questions with choices and comments are imported with counters
+        """
+        path = self.write_file('.jsonl', json.dumps({
+            'question_text': 'Imported question',
+            'pub_date': '2019-07-01T10:00:00',
+            'choices': [{'choice_text': 'Yes', 'votes': 3}, {'choice_text': 'No', 'votes': 1}],
+            'comments': [{'comment_text': 'Nice', 'positive': True}, {'comment_text': 'Bad', 'positive': False}],
+        }) + '\n')
+        call_command('import_polls', path, stdout=StringIO())
+        question = Question.objects.get()
+        self.assertEqual(question.question_text, 'Imported question')
+        self.assertEqual(
+            (question.total_votes, question.choice_count, question.comment_count,
+             question.positive_count, question.negative_count),
+            (4, 2, 2, 1, 1)
+        )
+        self.assertEqual(sorted(question.choice_set.values_list('choice_text', 'votes')), [('No', 1), ('Yes', 3)])
+
+    def test_import_csv_resumes_after_checkpoint(self):
+        """
+        Second run of the same file continues after last committed batch
+        """
+        path = self.write_file('.csv', (
+            'question_ref,question_text,pub_date,kind,text,value\n'
+            '1,First,2019-07-01 10:00,comment,Nice,1\n'
+            '1,First,2019-07-01 10:00,comment,Bad,0\n'
+            '2,Second,2019-07-02 10:00,choice,Yes,5\n'
+        ))
+        call_command('import_polls', path, batch_size=1, stdout=StringIO())
+        self.assertEqual(Question.objects.count(), 2)
+        self.assertEqual(Question.objects.get(question_text='First').negative_count, 1)
+        call_command('import_polls', path, stdout=StringIO())
+        self.assertEqual(Question.objects.count(), 2)
+
+    def test_children_written_in_batches(self):
+        """
+        Comments of one question are inserted batch_size rows per statement
+        """
+        path = self.write_file('.jsonl', json.dumps({
+            'question_text': 'Many comments', 'pub_date': '2019-07-01T10:00:00',
+            'comments': [{'comment_text': 'Comment {}'.format(number)} for number in range(5)],
+        }) + '\n')
+        with CaptureQueriesContext(connection) as context:
+            call_command('import_polls', path, batch_size=2, stdout=StringIO())
+        inserts = [query for query in context.captured_queries
+                   if query['sql'].startswith('INSERT INTO "polls_comment"')]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(Question.objects.get().comment_set.count(), 5)
+
+    def test_copy_keeps_empty_text(self):
+        """
+        COPY file quotes empty comment_text, so it isn't loaded as NULL
+        """
+        buffer = import_polls.copy_buffer([(1, '', True)])
+        self.assertEqual(buffer.read(), '"1","","True"\r\n')
+
+class QuestionAdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_changelist_query_count_doesnt_grow_with_questions(self):
+        """
+        Changelist with comment counters runs same amount of queries
+        for 1 and for 10 questions
+        """
+        def changelist_queries():
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(reverse('admin:polls_question_changelist'))
+            self.assertEqual(response.status_code, 200)
+            return len(context)
+
+        question = create_question(question_text="Question", days=-1)
+        question.comment_set.create(comment_text='', positive=False)
+        one_question_queries = changelist_queries()
+        for i in range(9):
+            question = create_question(question_text="Question {}".format(i), days=-1)
+            question.comment_set.create(comment_text='', positive=True)
+        self.assertEqual(changelist_queries(), one_question_queries)
+
+    def test_changelist_sorts_by_comment_counter(self):
+        """
+        Comment counter columns are sortable
+        """
+        create_question(question_text="Quiet question", days=-1)
+        loud_question = create_question(question_text="Loud question", days=-1)
+        loud_question.comment_set.create(comment_text='', positive=True)
+        #'o' param is index of count_comments in list_display, '-' for descending
+        response = self.client.get(reverse('admin:polls_question_changelist'), {'o': '-3'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [question.question_text for question in response.context['cl'].result_list],
+            ['Loud question', 'Quiet question']
+        )
+
+class QuestionCountersTests(TestCase):
+    """Tests for stored question counters"""
+    def test_vote_increments_total_votes(self):
+        """
+        vote() adds vote to choice and to question's total_votes
+        """
+        question = create_question(question_text="Question", days=-1)
+        choice = question.choice_set.create(choice_text='Choice')
+        self.client.post(reverse('polls:vote', args=(question.id,)), {'choice': choice.id})
+        question.refresh_from_db()
+        choice.refresh_from_db()
+        self.assertEqual((choice.votes, question.total_votes, question.choice_count), (1, 1, 1))
+
+    def test_vote_takes_three_statements(self):
+        """
+        Successful vote runs choice and question UPDATEs,
+        vote history INSERT and nothing else
+        """
+        question = create_question(question_text="Question", days=-1)
+        choice = question.choice_set.create(choice_text='Choice')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(reverse('polls:vote', args=(question.id,)), {'choice': choice.id})
+        self.assertEqual(response.status_code, 302)
+        statements = [query['sql'].split()[0] for query in context.captured_queries
+                      if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(statements, ['UPDATE', 'UPDATE', 'INSERT'])
+
+    def test_vote_for_choice_of_other_question(self):
+        """
+        Choice of another question isn't counted, detail page shows error
+        """
+        question = create_question(question_text="Question", days=-1)
+        other_choice = create_question(question_text="Other", days=-1).choice_set.create(choice_text='Other')
+        response = self.client.post(reverse('polls:vote', args=(question.id,)), {'choice': other_choice.id})
+        self.assertContains(response, "You didn&#39;t select a choice")
+        other_choice.refresh_from_db()
+        self.assertEqual(other_choice.votes, 0)
+
+    def test_vote_for_missing_question(self):
+        """
+        Vote for question that doesn't exist returns 404
+        """
+        response = self.client.post(reverse('polls:vote', args=(999,)), {'choice': 1})
+        self.assertEqual(response.status_code, 404)
+
+    def test_leave_comment_counts_negative_comment(self):
+        """
+        leave_comment() counts 'False' from form as negative comment
+        """
+        question = create_question(question_text="Question", days=-1)
+        self.client.post(
+            reverse('polls:leave_comment', args=(question.id,)),
+            {'comment_text': 'Hate it', 'is_positive': 'False'}
+        )
+        question.refresh_from_db()
+        self.assertEqual(
+            (question.comment_count, question.positive_count, question.negative_count),
+            (1, 0, 1)
+        )
+
+    def test_rebuild_poll_counters_fixes_drift(self):
+        """
+        rebuild_poll_counters command recalculates counters from child tables
+        """
+        question = create_question(question_text="Question", days=-1)
+        question.choice_set.create(choice_text='Choice', votes=3)
+        question.comment_set.create(comment_text='', positive=False)
+        Question.objects.update(total_votes=100, comment_count=0, negative_count=0)
+        call_command('rebuild_poll_counters', stdout=StringIO())
+        question.refresh_from_db()
+        self.assertEqual(
+            (question.total_votes, question.choice_count, question.comment_count,
+             question.positive_count, question.negative_count),
+            (3, 1, 1, 0, 1)
+        )
+
+    def test_admin_inline_delete_updates_counters(self):
+        """
+        Deleting comment in question change form updates counters
+        """
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        question = create_question(question_text="Question", days=-1)
+        comment = question.comment_set.create(comment_text='Bye', positive=True)
+        self.client.post(reverse('admin:polls_question_change', args=(question.id,)), {
+            'question_text': question.question_text,
+            'pub_date_0': question.pub_date.strftime('%Y-%m-%d'),
+            'pub_date_1': question.pub_date.strftime('%H:%M:%S'),
+            'choice_set-TOTAL_FORMS': '0',
+            'choice_set-INITIAL_FORMS': '0',
+            'comment_set-TOTAL_FORMS': '1',
+            'comment_set-INITIAL_FORMS': '1',
+            'comment_set-0-id': comment.id,
+            'comment_set-0-question': question.id,
+            'comment_set-0-comment_text': comment.comment_text,
+            'comment_set-0-positive': 'on',
+            'comment_set-0-DELETE': 'on',
+        })
+        question.refresh_from_db()
+        self.assertEqual((question.comment_count, question.positive_count), (0, 0))
+
+class QueryPlanTests(TestCase):
+    def test_hot_queries_use_indexes(self):
+        """
+        explain_polls finds index in query plan of every hot query
+        """
+        out = StringIO()
+        call_command('explain_polls', stdout=out)
+        self.assertNotIn("NO INDEX", out.getvalue())
+
+class VoteBufferTests(TestCase):
+    """Tests for write-behind vote buffer"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.question = create_question(question_text="Question", days=-1)
+        cls.first_choice = cls.question.choice_set.create(choice_text='First')
+        cls.second_choice = cls.question.choice_set.create(choice_text='Second')
+
+    def test_flush_writes_batched_votes(self):
+        """
+        flush() writes all pending votes to choices and question counter
+        """
+        vote_buffer = votes.VoteBuffer(flush_interval=3600, flush_size=1000)
+        for _ in range(3):
+            vote_buffer.add(self.question.pk, self.first_choice.pk)
+        vote_buffer.add(self.question.pk, self.second_choice.pk)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(vote_buffer.flush(), 4)
+        updates = [query for query in context.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)
+        self.first_choice.refresh_from_db()
+        self.second_choice.refresh_from_db()
+        self.question.refresh_from_db()
+        self.assertEqual(
+            (self.first_choice.votes, self.second_choice.votes, self.question.total_votes),
+            (3, 1, 4)
+        )
+        self.assertEqual(vote_buffer.pending(self.question.pk), {})
+
+    def test_flush_size_wakes_flusher(self):
+        """
+        Reaching flush_size makes flusher thread write votes without waiting
+        for flush_interval, voter's thread doesn't write them
+        """
+        written = threading.Event()
+        writers = []
+        def apply(batch):
+            writers.append((threading.current_thread().name, dict(batch)))
+            written.set()
+        vote_buffer = votes.VoteBuffer(flush_interval=3600, flush_size=2, apply=apply)
+        vote_buffer.start()
+        self.addCleanup(vote_buffer.stop)
+        vote_buffer.add(self.question.pk, self.first_choice.pk)
+        vote_buffer.add(self.question.pk, self.first_choice.pk)
+        self.assertTrue(written.wait(5))
+        self.assertEqual(writers, [('vote-buffer', {(self.question.pk, self.first_choice.pk): 2})])
+
+    @override_settings(POLLS_VOTE_BUFFER={'ENABLED': True, 'FLUSH_INTERVAL': 3600})
+    def test_results_page_shows_pending_votes(self):
+        """
+        With vote buffer voter sees own vote on results page before it is flushed
+        """
+        self.addCleanup(setattr, votes, '_vote_buffer', None)
+        self.client.post(reverse('polls:vote', args=(self.question.id,)), {'choice': self.first_choice.id})
+        self.first_choice.refresh_from_db()
+        self.assertEqual(self.first_choice.votes, 0)
+        response = self.client.get(reverse('polls:results', args=(self.question.id,)))
+        self.assertEqual(response.context['choices'][0].votes, 1)
+        votes.get_vote_buffer().stop()
+        self.first_choice.refresh_from_db()
+        self.assertEqual(self.first_choice.votes, 1)
+
+class ThrottleTests(TestCase):
+    """Tests for vote and comment throttling"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.question = create_question(question_text="Question", days=-1)
+        cls.choice = cls.question.choice_set.create(choice_text='Choice')
+
+    def setUp(self):
+        self.addCleanup(setattr, throttle, '_throttle', None)
+
+    def test_token_bucket_refills(self):
+        """
+        Bucket lets burst through, then one request per refilled token
+        """
+        now = [0.0]
+        backend = throttle.LocalThrottleBackend(clock=lambda: now[0])
+        self.assertEqual([backend.take('key', 2, 1.0) for _ in range(3)], [0, 0, 1.0])
+        now[0] = 1.0
+        self.assertEqual(backend.take('key', 2, 1.0), 0)
+
+    def test_dedup_window_expires(self):
+        """
+        Key is a duplicate within window and forgotten after two windows
+        """
+        now = [0.0]
+        backend = throttle.LocalThrottleBackend(dedup_seconds=10, clock=lambda: now[0])
+        self.assertTrue(backend.add_once('key'))
+        now[0] = 15.0
+        self.assertFalse(backend.add_once('key'))
+        now[0] = 30.0
+        self.assertTrue(backend.add_once('key'))
+
+    @override_settings(POLLS_THROTTLE={'ENABLED': True})
+    def test_duplicate_vote_skips_database(self):
+        """
+        Second vote of same client within dedup window is redirected without queries
+        """
+        url = reverse('polls:vote', args=(self.question.id,))
+        self.client.post(url, {'choice': self.choice.id})
+        with self.assertNumQueries(0):
+            response = self.client.post(url, {'choice': self.choice.id})
+        self.assertRedirects(response, reverse('polls:results', args=(self.question.id,)))
+        self.choice.refresh_from_db()
+        self.assertEqual(self.choice.votes, 1)
+
+    @override_settings(POLLS_THROTTLE={'ENABLED': True, 'RATES': {
+        'comment': {'CLIENT': (2, 0.001), 'QUESTION': (100, 1.0)}}})
+    def test_client_over_rate_gets_429(self):
+        """
+        Client that used up its burst gets 429 with Retry-After before any query
+        """
+        url = reverse('polls:leave_comment', args=(self.question.id,))
+        for number in range(2):
+            self.client.post(url, {'comment_text': 'Comment {}'.format(number), 'is_positive': 'True'})
+        with self.assertNumQueries(0):
+            response = self.client.post(url, {'comment_text': 'Comment 2', 'is_positive': 'True'})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 1)
+        self.assertEqual(self.question.comment_set.count(), 2)
+
+    @override_settings(POLLS_THROTTLE={'ENABLED': True, 'BACKEND': 'cache', 'RATES': {
+        'vote': {'CLIENT': (100, 1.0), 'QUESTION': (1, 0.001)}}})
+    def test_cache_backend_limits_question(self):
+        """
+        Cache backend shares question bucket between clients,
+        throttled vote isn't remembered as duplicate
+        """
+        cache.clear()
+        self.addCleanup(cache.clear)
+        url = reverse('polls:vote', args=(self.question.id,))
+        self.client.post(url, {'choice': self.choice.id}, REMOTE_ADDR='10.0.0.1')
+        response = self.client.post(url, {'choice': self.choice.id}, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 429)
+        throttle_ = throttle.get_throttle()
+        self.assertTrue(throttle_.backend.add_once(throttle_.dedup_key('vote', '10.0.0.2', self.question.id, 'vote')))
+
+    @override_settings(POLLS_THROTTLE={'ENABLED': True})
+    def test_rejected_vote_is_forgotten(self):
+        """
+        Vote for missing choice (form shown again) or question (404)
+        doesn't make next vote a duplicate
+        """
+        url = reverse('polls:vote', args=(self.question.id,))
+        response = self.client.post(url, {'choice': self.choice.id + 100})
+        self.assertContains(response, "select a choice")
+        self.assertEqual(self.client.post(reverse('polls:vote', args=(self.question.id + 100,)),
+                                          {'choice': self.choice.id}).status_code, 404)
+        self.client.post(url, {'choice': self.choice.id})
+        self.choice.refresh_from_db()
+        self.assertEqual(self.choice.votes, 1)
+
+    @override_settings(POLLS_THROTTLE={'ENABLED': True})
+    def test_voters_behind_one_address(self):
+        """
+        Browsers sharing address are deduped by their CSRF cookies
+        """
+        url = reverse('polls:vote', args=(self.question.id,))
+        for token in ('a' * 64, 'b' * 64, 'b' * 64):
+            self.client.cookies[settings.CSRF_COOKIE_NAME] = token
+            self.client.post(url, {'choice': self.choice.id}, REMOTE_ADDR='10.0.0.1')
+        self.choice.refresh_from_db()
+        self.assertEqual(self.choice.votes, 2)
+
+class CommentQueueTests(TestCase):
+    """Tests for queued comment ingestion"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.question = create_question(question_text="Question", days=-1)
+
+    def test_flush_writes_batches_and_counters(self):
+        """
+        flush() writes queued comments with one INSERT per batch and updates counters
+        """
+        comment_queue = comments.CommentQueue(batch_size=2)
+        for positive in (True, True, False):
+            comment_queue.put(Comment(question_id=self.question.pk, comment_text='Comment',
+                                               positive=positive))
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(comment_queue.flush(), 3)
+        inserts = [query for query in context.captured_queries if query['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 2)
+        self.question.refresh_from_db()
+        self.assertEqual(
+            (self.question.comment_count, self.question.positive_count, self.question.negative_count),
+            (3, 2, 1)
+        )
+
+    def test_full_queue_rejects_comment(self):
+        """
+        put() gives up after timeout when queue is full
+        """
+        comment_queue = comments.CommentQueue(max_size=1)
+        self.assertTrue(comment_queue.put(Comment(question_id=self.question.pk), timeout=0))
+        self.assertFalse(comment_queue.put(Comment(question_id=self.question.pk), timeout=0))
+
+    @override_settings(POLLS_COMMENT_QUEUE={'ENABLED': True, 'PUT_TIMEOUT': 0})
+    def test_queued_comment_answers_202(self):
+        """
+        With comment queue view answers 202 and comment is written by flush,
+        invalid comment gets 400 and full queue 503
+        """
+        comment_queue = comments.CommentQueue(max_size=1)
+        self.addCleanup(setattr, comments, '_comment_queue', None)
+        comments._comment_queue = comment_queue
+        url = reverse('polls:leave_comment', args=(self.question.id,))
+        response = self.client.post(url, {'comment_text': 'Queued', 'is_positive': 'False'})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.client.post(url, {'comment_text': '', 'is_positive': 'True'}).status_code, 400)
+        self.assertEqual(self.client.post(url, {'comment_text': 'More', 'is_positive': 'True'}).status_code, 503)
+        comment_queue.flush()
+        self.assertEqual(self.question.comment_set.get().comment_text, 'Queued')
+
+    @override_settings(POLLS_COMMENT_QUEUE={'ENABLED': True, 'PUT_TIMEOUT': 0},
+                       POLLS_THROTTLE={'ENABLED': True})
+    def test_retry_after_full_queue_is_stored(self):
+        """
+        Comment answered 503 isn't remembered by throttle dedup, retry is queued and written
+        """
+        self.addCleanup(setattr, throttle, '_throttle', None)
+        comment_queue = comments.CommentQueue(max_size=1)
+        self.addCleanup(setattr, comments, '_comment_queue', None)
+        comments._comment_queue = comment_queue
+        comment_queue.put(Comment(question_id=self.question.pk, comment_text='Filler'), timeout=0)
+        url = reverse('polls:leave_comment', args=(self.question.id,))
+        data = {'comment_text': 'Retried', 'is_positive': 'True'}
+        response = self.client.post(url, data)
+        self.assertEqual((response.status_code, response['Retry-After']), (503, '1'))
+        comment_queue.flush()
+        self.assertEqual(self.client.post(url, data).status_code, 202)
+        comment_queue.flush()
+        self.assertTrue(self.question.comment_set.filter(comment_text='Retried').exists())
+
+class AdminPerformanceTests(TestCase):
+    """Tests for admin on big question and comment tables"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.question = create_question(question_text="Question", days=-1)
+        Comment.objects.bulk_create(
+            Comment(question=cls.question, comment_text='Comment {}'.format(number)) for number in range(30))
+        Question.objects.rebuild_counters()
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    @override_settings(POLLS_ADMIN={'INLINE_COMMENTS': 5})
+    def test_change_form_shows_latest_comments(self):
+        """
+        Change form has forms for latest INLINE_COMMENTS comments and link to all of them
+        """
+        response = self.client.get(reverse('admin:polls_question_change', args=(self.question.id,)))
+        formset = response.context['inline_admin_formsets'][1].formset
+        self.assertEqual([form.instance.comment_text for form in formset.initial_forms],
+                         ['Comment {}'.format(number) for number in range(29, 24, -1)])
+        self.assertContains(response, 'All 30 comments')
+        response = self.client.get(reverse('admin:polls_comment_changelist'),
+                                   {'question__id__exact': self.question.id})
+        self.assertEqual(response.context['cl'].result_count, 30)
+
+    def test_estimated_count_paginator(self):
+        """
+        Paginator counts rows if there is no estimate or it is under threshold
+        (SQLite has no estimate)
+        """
+        paginator = EstimatedCountPaginator(Question.objects.all(), 10)
+        self.assertIsNone(estimated_count(Question.objects.all()))
+        self.assertEqual(paginator.count, 1)
+
+    def test_changelist_skips_full_count(self):
+        """
+        Filtered changelist runs one COUNT, not another one of whole table
+        """
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('admin:polls_question_changelist'),
+                                       {'pub_date__year': self.question.pub_date.year})
+        self.assertEqual(response.status_code, 200)
+        counts = [query for query in context.captured_queries if 'COUNT(' in query['sql']]
+        self.assertEqual(len(counts), 1)
+
+    def test_comment_admin_delete_updates_counters(self):
+        """
+        Deleting comment in comments admin updates question counters
+        """
+        comment = self.question.comment_set.first()
+        self.client.post(reverse('admin:polls_comment_delete', args=(comment.id,)), {'post': 'yes'})
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.comment_count, 29)
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'fragments': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-fragments'},
+})
+class FragmentCacheTests(TestCase):
+    """Tests for cached fragments of question pages"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.question = create_question(question_text="Question", days=-1)
+        cls.choice = cls.question.choice_set.create(choice_text='Choice')
+        cls.question.comment_set.create(comment_text='Comment')
+
+    def setUp(self):
+        self.addCleanup(caches['fragments'].clear)
+
+    def test_cached_choices_skip_query(self):
+        """
+        Second render of detail page reads only question, vote doesn't
+        render choices again, edit of choice does
+        """
+        url = reverse('polls:detail', args=(self.question.id,))
+        with self.assertNumQueries(2):
+            self.client.get(url)
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertContains(response, 'Choice')
+        self.client.post(reverse('polls:vote', args=(self.question.id,)), {'choice': self.choice.id})
+        with self.assertNumQueries(1):
+            self.client.get(url)
+        self.choice.choice_text = 'Edited choice'
+        self.choice.save()
+        with self.assertNumQueries(2):
+            self.assertContains(self.client.get(url), 'Edited choice')
+
+    def test_new_comment_shows_up(self):
+        """
+        Comments fragment is keyed by question version, new comment isn't hidden by it
+        """
+        url = reverse('polls:comments', args=(self.question.id,))
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            self.client.get(url)
+        self.client.post(reverse('polls:leave_comment', args=(self.question.id,)),
+                         {'comment_text': 'Fresh comment', 'is_positive': 'True'})
+        self.assertContains(self.client.get(url), 'Fresh comment')
+
+@override_settings(POLLS_VOTE_SHARDS={'ENABLED': True, 'SHARDS': 4})
+class VoteShardsTests(TestCase):
+    """Tests for sharded vote counters"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.question = create_question(question_text="Question", days=-1)
+        cls.choice = cls.question.choice_set.create(choice_text='Choice', votes=10)
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_vote_goes_to_shard(self):
+        """
+        Vote updates one shard, not choice or question, results add shard sums
+        """
+        for _ in range(3):
+            self.client.post(reverse('polls:vote', args=(self.question.id,)), {'choice': self.choice.id})
+        self.choice.refresh_from_db()
+        self.assertEqual(self.choice.votes, 10)
+        self.assertEqual(self.question.choicevoteshard_set.count(), 4)
+        self.assertEqual(shards.sharded_votes(self.question.id), {self.choice.id: 3})
+        response = self.client.get(reverse('polls:results', args=(self.question.id,)))
+        self.assertEqual(response.context['choices'][0].votes, 13)
+        response = self.client.get(reverse('polls:results_json', args=(self.question.id,)))
+        self.assertEqual(response.json()['choices'][0]['votes'], 13)
+
+    def test_vote_for_choice_of_other_question(self):
+        """
+        Choice of another question gets no shards
+        """
+        other = create_question(question_text="Other", days=-1)
+        self.assertFalse(shards.write_sharded_vote(other.id, self.choice.id))
+        self.assertFalse(self.question.choicevoteshard_set.exists())
+
+    def test_fold_moves_votes_to_columns(self):
+        """
+        fold_vote_shards moves shard sums to choice votes and question total_votes
+        """
+        for _ in range(5):
+            shards.write_sharded_vote(self.question.id, self.choice.id)
+        call_command('fold_vote_shards', stdout=StringIO())
+        self.choice.refresh_from_db()
+        self.question.refresh_from_db()
+        self.assertEqual((self.choice.votes, self.question.total_votes), (15, 15))
+        self.assertEqual(shards.sharded_votes(self.question.id), {self.choice.id: 0})
+
+    def test_fold_drops_cached_sums(self):
+        """
+        Sums cached before fold aren't added to folded votes column
+        """
+        shards.write_sharded_vote(self.question.id, self.choice.id)
+        url = reverse('polls:results_json', args=(self.question.id,))
+        self.assertEqual(self.client.get(url).json()['choices'][0]['votes'], 11)
+        shards.fold_shards()
+        self.assertEqual(self.client.get(url).json()['choices'][0]['votes'], 11)
+
+    def test_live_tallies_see_every_vote(self):
+        """
+        Live results read shard sums uncached, second vote within cache time shows up
+        """
+        hub = ResultsHub()
+        updates = hub.subscribe(self.question.id)
+        for expected in (11, 12):
+            shards.write_sharded_vote(self.question.id, self.choice.id)
+            hub.notify(self.question.id)
+            hub.publish()
+            self.assertEqual(updates.get_nowait(), {self.choice.id: expected})
+
+    def test_export_adds_shard_votes(self):
+        """
+        Export counts votes not folded yet, and its ETag changes with them
+        """
+        url = reverse('polls:export_results')
+        etag = self.client.get(url)['ETag']
+        shards.write_sharded_vote(self.question.id, self.choice.id)
+        response = self.client.get(url, {'format': 'csv'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[1:], ['{},Question,{},Choice,11'.format(self.question.id, self.choice.id)])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_admin_shows_total_votes(self):
+        """
+        Choice inline shows votes column plus shard votes
+        """
+        shards.write_sharded_vote(self.question.id, self.choice.id)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        response = self.client.get(reverse('admin:polls_question_change', args=(self.question.id,)))
+        choice = response.context['inline_admin_formsets'][0].formset.initial_forms[0].instance
+        self.assertEqual(choice.shard_votes, 1)
@@ -0,0 +1,255 @@
+"""
+Vote and comment throttling
+
+Every POST to vote or leave_comment takes a token from the client's bucket
+and from the question's bucket, and is checked against a sliding-window
+set of recent (browser, question) submissions. Requests that fail any check
+are answered before the view touches the database: 429 with Retry-After
+when a bucket is empty, redirect as if accepted for a duplicate.
+Submission the view doesn't accept (error status or form shown again)
+is forgotten, so it can be sent again right away.
+
+Two backends keep the state: 'local' (this process only, no I/O) and
+'cache' (Django cache, shared by all workers if the cache itself is shared,
+memcached or redis, not local memory).
+"""
+import functools
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseRedirect
+from django.urls import reverse
+
+THROTTLE_DEFAULTS = {
+    'ENABLED': False,
+    #'local' or 'cache'
+    'BACKEND': 'local',
+    #cache of 'cache' backend, see CACHES
+    'CACHE_ALIAS': 'default',
+    #(burst, tokens per second) of every scope
+    'RATES': {
+        'vote': {'CLIENT': (10, 1.0), 'QUESTION': (500, 200.0)},
+        'comment': {'CLIENT': (5, 0.2), 'QUESTION': (100, 20.0)},
+    },
+    #seconds same browser's second submission to same question is dropped
+    #browser is told by CSRF cookie, voters behind one NAT or proxy aren't
+    #deduped together. NOTE: client clearing cookies isn't deduped either,
+    #only rate limited by address
+    'DEDUP_SECONDS': 10,
+    #buckets 'local' backend keeps, least recently used ones are forgotten
+    'MAX_BUCKETS': 100000,
+    #request.META key with client address, for example 'HTTP_X_FORWARDED_FOR'
+    #NOTE: set it only if proxy in front overwrites that header,
+    #otherwise clients pick their own address
+    'CLIENT_ADDRESS_HEADER': 'REMOTE_ADDR',
+}
+
+def throttle_settings():
+    return {**THROTTLE_DEFAULTS, **getattr(settings, 'POLLS_THROTTLE', {})}
+
+def take_token(bucket, now, burst, rate):
+    """
+    Refills (tokens, updated) bucket up to now and takes one token from it
+    Returns (new bucket, seconds until next token or 0 if token was taken)
+    Missing bucket (None) starts full
+    """
+    tokens, updated = bucket if bucket is not None else (burst, now)
+    tokens = min(burst, tokens + (now - updated) * rate)
+    if tokens < 1:
+        return (tokens, now), (1 - tokens) / rate
+    return (tokens - 1, now), 0
+
+class LocalThrottleBackend:
+    """
+    Token buckets and dedup window in process memory
+
+    Dedup window keeps hashes of keys in two sets: current and previous
+    window. A key is dropped after one to two windows, and memory is
+    bounded by submissions of the last two windows.
+    """
+    def __init__(self, dedup_seconds=10, max_buckets=100000, clock=time.monotonic):
+        self.dedup_seconds = dedup_seconds
+        self.max_buckets = max_buckets
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+        self._window_start = clock()
+        self._current = set()
+        self._previous = set()
+
+    def take(self, key, burst, rate):
+        with self._lock:
+            bucket, retry_after = take_token(self._buckets.get(key), self._clock(), burst, rate)
+            self._buckets[key] = bucket
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+    def _rotate(self):
+        now = self._clock()
+        if now - self._window_start >= 2 * self.dedup_seconds:
+            self._previous, self._current = set(), set()
+            self._window_start = now
+        elif now - self._window_start >= self.dedup_seconds:
+            self._previous, self._current = self._current, set()
+            self._window_start += self.dedup_seconds
+
+    def add_once(self, key):
+        """Remembers key, returns False if it was already seen within window"""
+        key = hash(key)
+        with self._lock:
+            self._rotate()
+            if key in self._current or key in self._previous:
+                return False
+            self._current.add(key)
+            return True
+
+    def forget(self, key):
+        key = hash(key)
+        with self._lock:
+            self._current.discard(key)
+            self._previous.discard(key)
+
+class CacheThrottleBackend:
+    """
+    Token buckets and dedup window in Django cache, shared by all workers
+    NOTE: only if CACHE_ALIAS is a shared cache, LocMemCache is per process
+    Dedup uses cache.add, which is atomic on memcached and redis
+    NOTE: buckets are read and written back without lock, so concurrent
+    requests of one client may get a few more tokens than burst
+    """
+    key_prefix = 'polls:throttle:'
+
+    def __init__(self, cache_alias='default', dedup_seconds=10, clock=time.time):
+        self.cache = caches[cache_alias]
+        self.dedup_seconds = dedup_seconds
+        self._clock = clock
+
+    def _key(self, key):
+        digest = hashlib.md5(repr(key).encode()).hexdigest()
+        return self.key_prefix + digest
+
+    def take(self, key, burst, rate):
+        cache_key = self._key(key)
+        bucket, retry_after = take_token(self.cache.get(cache_key), self._clock(), burst, rate)
+        #empty bucket is full again after this many seconds, then it needn't be kept
+        self.cache.set(cache_key, bucket, int(burst / rate) + 1)
+        return retry_after
+
+    def add_once(self, key):
+        return self.cache.add(self._key(key), 1, self.dedup_seconds)
+
+    def forget(self, key):
+        self.cache.delete(self._key(key))
+
+class Throttle:
+    """Applies per-client and per-question rates and dedup window of every scope"""
+    def __init__(self, backend, rates):
+        self.backend = backend
+        self.rates = rates
+
+    def dedup_key(self, scope, voter, question_id, key):
+        """Returns key submission is remembered under in dedup window"""
+        return (scope, voter, question_id, key)
+
+    def forget(self, scope, voter, question_id, key):
+        """Lets submission that wasn't accepted be sent again"""
+        self.backend.forget(self.dedup_key(scope, voter, question_id, key))
+
+    def check(self, scope, client, question_id, dedup_key=None, voter=None):
+        """
+        Returns None if submission may go through,
+        ('duplicate', 0) or ('throttled', seconds to retry after) otherwise
+        Rates apply to client address, dedup to voter (client if not given)
+        Duplicates don't take tokens from question bucket shared by all clients
+        """
+        rates = self.rates[scope]
+        retry_after = self.backend.take((scope, 'client', client), *rates['CLIENT'])
+        if retry_after:
+            return ('throttled', retry_after)
+        if dedup_key is not None:
+            dedup_key = self.dedup_key(scope, voter or client, question_id, dedup_key)
+            if not self.backend.add_once(dedup_key):
+                return ('duplicate', 0)
+        retry_after = self.backend.take((scope, 'question', question_id), *rates['QUESTION'])
+        if retry_after:
+            if dedup_key is not None:
+                #rejected submission may be sent again
+                self.backend.forget(dedup_key)
+            return ('throttled', retry_after)
+        return None
+
+def client_address(request):
+    header = throttle_settings()['CLIENT_ADDRESS_HEADER']
+    #proxies append addresses, first one is the client
+    return request.META.get(header, '').split(',')[0].strip()
+
+def voter_identity(request):
+    """CSRF cookie of browser or client address if it has none"""
+    return request.COOKIES.get(settings.CSRF_COOKIE_NAME) or client_address(request)
+
+def accepted(response):
+    """
+    View took submission if it redirected or answered 202,
+    error status or form rendered again (200) means it didn't
+    """
+    return response.status_code == 202 or 300 <= response.status_code < 400
+
+def throttled(scope, redirect_to, dedup_key=None):
+    """
+    Throttles POST view taking question_id
+    dedup_key(request) returns what makes submissions equal (or None to skip dedup),
+    duplicates are redirected to redirect_to URL name without reaching the view
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, question_id, *args, **kwargs):
+            throttle = get_throttle()
+            if throttle is None or request.method != 'POST':
+                return view(request, question_id, *args, **kwargs)
+            key = dedup_key(request) if dedup_key is not None else None
+            voter = voter_identity(request)
+            rejection = throttle.check(scope, client_address(request), question_id, key, voter)
+            if rejection is not None:
+                reason, retry_after = rejection
+                if reason == 'duplicate':
+                    return HttpResponseRedirect(reverse(redirect_to, args=(question_id,)))
+                response = HttpResponse("Too many requests, try again later", status=429)
+                response['Retry-After'] = int(retry_after) + 1
+                return response
+            try:
+                response = view(request, question_id, *args, **kwargs)
+            except Exception:
+                #404 or broken form, nothing was recorded
+                if key is not None:
+                    throttle.forget(scope, voter, question_id, key)
+                raise
+            if key is not None and not accepted(response):
+                throttle.forget(scope, voter, question_id, key)
+            return response
+        return wrapper
+    return decorator
+
+_throttle = None
+_throttle_lock = threading.Lock()
+
+def get_throttle():
+    """Returns process-wide Throttle or None if disabled"""
+    global _throttle
+    options = throttle_settings()
+    if not options['ENABLED']:
+        return None
+    if _throttle is None:
+        with _throttle_lock:
+            if _throttle is None:
+                if options['BACKEND'] == 'cache':
+                    backend = CacheThrottleBackend(options['CACHE_ALIAS'], options['DEDUP_SECONDS'])
+                else:
+                    backend = LocalThrottleBackend(options['DEDUP_SECONDS'], options['MAX_BUCKETS'])
+                _throttle = Throttle(backend, {**THROTTLE_DEFAULTS['RATES'], **options['RATES']})
+    return _throttle
@@ -1,5 +1,28 @@
 from django.urls import path
-from . import views
+from django.utils.module_loading import import_string
+
+class LazyView:
+    """
+    View imported from polls.views on first request
+    Loading URLconf (manage.py commands, worker start) doesn't import
+    views and everything they use
+    """
+    def __init__(self, name, **initkwargs):
+        self.name = name
+        self.initkwargs = initkwargs
+        self.view = None
+
+    def __call__(self, request, *args, **kwargs):
+        if self.view is None:
+            view = import_string('polls.views.{}'.format(self.name))
+            #class based views are given by class name
+            if hasattr(view, 'as_view'):
+                view = view.as_view(**self.initkwargs)
+            self.view = view
+        return self.view(request, *args, **kwargs)
+
+    def __repr__(self):
+        return '<LazyView polls.views.{}>'.format(self.name)
 
 app_name = 'polls'
 # urlpatterns = [
@@ -12,11 +35,17 @@ app_name = 'polls'
 
 urlpatterns = [
     #generic views
-    path('', views.IndexView.as_view(), name='index'),
-    path('<int:pk>/', views.DetailView.as_view(), name='detail'),
-    path('<int:pk>/results/', views.ResultsView.as_view(), name='results'),
-    path('<int:pk>/comments/', views.CommentsView.as_view(), name='comments'),
+    path('', LazyView('IndexView'), name='index'),
+    path('<int:pk>/', LazyView('DetailView'), name='detail'),
+    path('<int:pk>/results/', LazyView('ResultsView'), name='results'),
+    path('<int:pk>/comments/', LazyView('CommentsView'), name='comments'),
     #non-generic views
-    path('<int:question_id>/vote/', views.vote, name='vote'),
-    path('<int:question_id>/leave_comment/', views.leave_comment, name='leave_comment'),
+    path('<int:pk>/results.json', LazyView('results_json'), name='results_json'),
+    path('<int:pk>/results/trend.json', LazyView('results_trend'), name='results_trend'),
+    path('<int:pk>/results/stream/', LazyView('results_stream'), name='results_stream'),
+    path('results/export/', LazyView('export_results'), name='export_results'),
+    path('search/', LazyView('search'), name='search'),
+    path('<int:pk>/comments/export/', LazyView('export_comments'), name='export_comments'),
+    path('<int:question_id>/vote/', LazyView('vote'), name='vote'),
+    path('<int:question_id>/leave_comment/', LazyView('leave_comment'), name='leave_comment'),
 ]
\ No newline at end of file
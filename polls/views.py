@@ -1,11 +1,33 @@
+import csv
+import hashlib
+import itertools
+import json
+import queue
+import time
+
+from django.conf import settings
 from django.shortcuts import get_object_or_404, render
-from django.http import HttpResponseRedirect
+from django.core.exceptions import ValidationError
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.utils.functional import cached_property
 from django.views import generic
 from django.utils import timezone
-from django.db.models import Count, F
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import Coalesce
+from django.views.decorators.http import condition
 
-from .models import Question, Choice, Comment
+from .cache import latest_questions
+from .comments import comment_queue_settings, get_comment_queue
+from .history import BUCKET_SIZE, vote_trend
+from .live import fetch_tallies, get_results_hub, live_results_settings, notify_results_changed
+from .models import Question, Choice, ChoiceVoteShard, Comment, VoteBucket
+from .search import search_comments, search_questions
+from .shards import vote_shards_settings
+from .throttle import throttled
+from .votes import pending_votes, record_vote
 
 class IndexView(generic.ListView):
     #override default template name <app name>/<model name>_list.html
@@ -19,22 +41,82 @@ class IndexView(generic.ListView):
         """
         Returns the last five published questions.
         """
-        now = timezone.now()
-        return Question.objects.filter(pub_date__lte=now).order_by('-pub_date')[:5]
+        return latest_questions()
+
+def page_question(request, queryset, pk):
+    """
+    Returns question of single question page (or None)
+    Read once per request, shared by ETag check and the view
+    """
+    if not hasattr(request, '_page_question'):
+        request._page_question = queryset.filter(pk=pk).first()
+    return request._page_question
+
+class QuestionPageMixin:
+    """
+    Conditional GET for pages of single question
+    Question row is read first and its version gives strong ETag,
+    so request with matching If-None-Match gets 304 before choices or
+    comments are queried. 200 reuses the same question, costs no extra query
+    """
+    #Cache-Control directives of 200 and 304 responses
+    cache_control = {}
+
+    def get_page_etag(self, question):
+        return '{}-{}'.format(question.pk, question.version)
+
+    def get_etag(self, request, pk):
+        question = page_question(request, self.get_queryset(), pk)
+        if question is not None:
+            return self.get_page_etag(question)
+
+    def get_cache_control(self):
+        return self.cache_control
+
+    def get_object(self, queryset=None):
+        question = page_question(self.request, self.get_queryset(), self.kwargs['pk'])
+        if question is None:
+            raise Http404("No question found matching the query")
+        return question
+
+    def dispatch(self, request, *args, **kwargs):
+        response = condition(etag_func=self.get_etag)(super().dispatch)(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            patch_cache_control(response, **self.get_cache_control())
+        return response
 
-class DetailView(generic.DetailView):
+def shared_cache_control():
+    """Lets shared caches keep page for POLLS_SHARED_CACHE_SECONDS, browsers revalidate every time"""
+    return {'public': True, 'max_age': 0, 's_maxage': settings.POLLS_SHARED_CACHE_SECONDS}
+
+class DetailView(QuestionPageMixin, generic.DetailView):
     #model name, duh
     model = Question
     #override default template name <app name>/<model name>_detail.html
     #default name: polls/question_detail.html
     template_name = 'polls/detail.html'
+    #page has forms with user's CSRF token, only browser may keep it
+    cache_control = {'private': True, 'no_cache': True}
+
     def get_queryset(self):
         """
         Returns questions with publishing date older than now.
+        Comment amount is read from stored counter so page takes
+        2 queries (question, choices) however many choices and comments there are
         """
         return Question.objects.filter(pub_date__lte=timezone.now())
 
-class ResultsView(generic.DetailView):
+    def get_page_etag(self, question):
+        #page rendered with another CSRF token would fail on submit
+        token = self.request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')
+        return '{}-{}'.format(super().get_page_etag(question), hashlib.md5(token.encode()).hexdigest()[:8])
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['choices'] = self.object.choice_set.all()
+        return context
+
+class ResultsView(QuestionPageMixin, generic.DetailView):
     model = Question
     template_name = 'polls/results.html'
 
@@ -42,9 +124,71 @@ class ResultsView(generic.DetailView):
         """
         Returns all questions with at least 1 choice.
         """
-        return Question.objects.annotate(num_choice=Count('choice')).filter(num_choice__gt=0)
+        return Question.objects.filter(choice_count__gt=0)
+
+    def get_page_etag(self, question):
+        #votes still in vote buffer or shards haven't bumped version yet
+        pending = sum(pending_votes(question.pk, question.version).values())
+        return '{}-{}'.format(super().get_page_etag(question), pending)
+
+    def get_cache_control(self):
+        return shared_cache_control()
+
+    def get_context_data(self, **kwargs):
+        """
+        Adds choices with votes that are still in vote buffer
+        so voter sees own vote right away
+        """
+        context = super().get_context_data(**kwargs)
+        pending = pending_votes(self.object.pk, self.object.version)
+        choices = list(self.object.choice_set.all())
+        for choice in choices:
+            choice.votes += pending.get(choice.pk, 0)
+        context['choices'] = choices
+        context['live_results'] = live_results_settings()['ENABLED']
+        return context
+
+SENTIMENTS = {'positive': True, 'negative': False}
+
+def filter_comments(question, params):
+    """
+    Returns question's comments in id order,
+    narrowed by 'sentiment' GET param (positive/negative)
+    """
+    comments = question.comment_set.order_by('id')
+    sentiment = params.get('sentiment')
+    if sentiment in SENTIMENTS:
+        comments = comments.filter(positive=SENTIMENTS[sentiment])
+    return comments
+
+class CommentsPage:
+    """One page of comments, queried on first use"""
+    def __init__(self, comments, after, page_size):
+        self.after = after
+        self.page_size = page_size
+        if after:
+            comments = comments.filter(id__gt=after)
+        self._comments = comments
+
+    @cached_property
+    def _rows(self):
+        #one extra comment tells if there is next page
+        return list(self._comments[:self.page_size + 1])
+
+    @property
+    def comments(self):
+        return self._rows[:self.page_size]
+
+    @property
+    def has_next(self):
+        return len(self._rows) > self.page_size
 
-class CommentsView(generic.DetailView):
+    @property
+    def next_cursor(self):
+        if self.has_next:
+            return self.comments[-1].id
+
+class CommentsView(QuestionPageMixin, generic.DetailView):
     model = Question
     template_name = 'polls/comments.html'
 
@@ -52,43 +196,314 @@ class CommentsView(generic.DetailView):
         """
         Returns all questions with at least 1 comment.
         """
-        return Question.objects.annotate(num_comment=Count('comment')).filter(num_comment__gt=0)
+        return Question.objects.filter(comment_count__gt=0)
+
+    def get_cache_control(self):
+        return shared_cache_control()
+
+    def get_context_data(self, **kwargs):
+        """
+        Adds one page of comments, read only if its fragment isn't cached
+        Pages are addressed by id of last comment on previous page ('after' GET param),
+        so any page is an index range scan and not OFFSET over earlier comments
+        """
+        context = super().get_context_data(**kwargs)
+        try:
+            after = int(self.request.GET.get('after', 0))
+        except ValueError:
+            after = 0
+        context['page'] = CommentsPage(
+            filter_comments(self.object, self.request.GET), after, settings.POLLS_COMMENTS_PAGE_SIZE)
+        context['sentiment'] = self.request.GET.get('sentiment', '')
+        return context
+
+class Echo:
+    """Pseudo-buffer that returns written value instead of storing it"""
+    def write(self, value):
+        return value
+
+def export_comments(request, pk):
+    """
+    Streams all comments of question as CSV
+    Comments are fetched in chunks, so memory use doesn't depend on amount of comments
+    """
+    question = get_object_or_404(Question, pk=pk, comment_count__gt=0)
+    rows = (filter_comments(question, request.GET)
+            .values_list('id', 'positive', 'comment_text')
+            .iterator(chunk_size=settings.POLLS_EXPORT_CHUNK_SIZE))
+    writer = csv.writer(Echo())
+    lines = itertools.chain([('id', 'positive', 'comment_text')], rows)
+    response = StreamingHttpResponse(
+        (writer.writerow(line) for line in lines),
+        content_type='text/csv',
+    )
+    response['Content-Disposition'] = 'attachment; filename="question_{}_comments.csv"'.format(pk)
+    return response
 
+def results_stamp(request, pk):
+    """
+    Returns (modified, total_votes, version) of question with results or None
+    Read once per request for both ETag and Last-Modified, touches only question row
+    """
+    if not hasattr(request, '_results_stamp'):
+        request._results_stamp = (Question.objects
+                                  .filter(pk=pk, choice_count__gt=0)
+                                  .values_list('modified', 'total_votes', 'version')
+                                  .first())
+    return request._results_stamp
+
+def results_etag(request, pk):
+    stamp = results_stamp(request, pk)
+    if stamp is not None:
+        modified, total_votes, version = stamp
+        #votes in vote buffer or shards don't change question row
+        pending = sum(pending_votes(pk, version).values())
+        return '{}-{}-{}-{}'.format(pk, modified.timestamp(), total_votes, pending)
+
+def results_last_modified(request, pk):
+    stamp = results_stamp(request, pk)
+    if stamp is not None:
+        return stamp[0]
+
+@condition(etag_func=results_etag, last_modified_func=results_last_modified)
+def results_json(request, pk):
+    """
+    Returns question's choices and votes as JSON, including votes still in
+    vote buffer or shards
+    Unchanged results return 304 without reading choices
+    NOTE: Last-Modified doesn't move with buffered or sharded votes,
+    only ETag does
+    """
+    question = get_object_or_404(Question, pk=pk, choice_count__gt=0)
+    pending = pending_votes(question.pk, question.version)
+    choices = list(question.choice_set.order_by('id').values('id', 'choice_text', 'votes'))
+    for choice in choices:
+        choice['votes'] += pending.get(choice['id'], 0)
+    return JsonResponse({
+        'id': question.id,
+        'question_text': question.question_text,
+        'total_votes': question.total_votes + sum(pending.values()),
+        'choices': choices,
+    })
+
+#most buckets one request may ask for
+TREND_MAX_BUCKETS = 24 * 31
+
+def results_trend(request, pk):
+    """
+    Returns votes per choice over time as chart data, read from vote rollups
+    ?resolution=minute|hour (default hour), ?buckets=N last buckets (default 24)
+    """
+    question = get_object_or_404(Question, pk=pk, choice_count__gt=0)
+    resolution = request.GET.get('resolution', VoteBucket.HOUR)
+    if resolution not in BUCKET_SIZE:
+        resolution = VoteBucket.HOUR
+    try:
+        buckets = min(max(int(request.GET.get('buckets', 24)), 1), TREND_MAX_BUCKETS)
+    except ValueError:
+        buckets = 24
+    trend = vote_trend(question.pk, resolution, since=timezone.now() - buckets * BUCKET_SIZE[resolution])
+    return JsonResponse({
+        'id': question.id,
+        'resolution': resolution,
+        'choices': list(question.choice_set.order_by('id').values('id', 'choice_text')),
+        'buckets': [{'start': start, 'votes': votes} for start, votes in trend],
+    })
+
+def export_stamp(request):
+    """
+    Returns (latest modified, amount) of published questions
+    and total of shard votes if sharded counters are on, read once per request
+    NOTE: shard total is a sum over whole shards table, sharded votes
+    don't change any question row
+    """
+    if not hasattr(request, '_export_stamp'):
+        request._export_stamp = (Question.objects
+                                 .filter(pub_date__lte=timezone.now())
+                                 .aggregate(latest=Max('modified'), amount=Count('id')))
+        if vote_shards_settings()['ENABLED']:
+            request._export_stamp.update(ChoiceVoteShard.objects.aggregate(shard_votes=Sum('votes')))
+    return request._export_stamp
+
+def export_etag(request):
+    stamp = export_stamp(request)
+    if stamp['latest'] is not None:
+        return 'export-{}-{}-{}-{}'.format(
+            request.GET.get('format', 'ndjson'), stamp['latest'].timestamp(), stamp['amount'],
+            stamp.get('shard_votes') or 0)
+
+def export_last_modified(request):
+    return export_stamp(request)['latest']
+
+@condition(etag_func=export_etag, last_modified_func=export_last_modified)
+def export_results(request):
+    """
+    Streams choice tallies of every published question
+    as NDJSON (one question per line, default) or CSV (one choice per line, ?format=csv)
+    Rows are read as tuples in chunks (server-side cursor on PostgreSQL)
+    With sharded counters, votes not folded yet are added in the same query
+    """
+    choices = (Choice.objects
+               .filter(question__pub_date__lte=timezone.now())
+               .order_by('question_id', 'id'))
+    if vote_shards_settings()['ENABLED']:
+        votes = F('votes') + Coalesce(Sum('choicevoteshard__votes'), 0)
+    else:
+        votes = F('votes')
+    rows = (choices
+            .annotate(total_votes=votes)
+            .values_list('question_id', 'question__question_text', 'id', 'choice_text', 'total_votes')
+            .iterator(chunk_size=settings.POLLS_EXPORT_CHUNK_SIZE))
+    if request.GET.get('format') == 'csv':
+        writer = csv.writer(Echo())
+        header = [('question_id', 'question_text', 'choice_id', 'choice_text', 'votes')]
+        lines = (writer.writerow(row) for row in itertools.chain(header, rows))
+        response = StreamingHttpResponse(lines, content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="results.csv"'
+        return response
+
+    def questions():
+        for (question_id, question_text), choices in itertools.groupby(rows, key=lambda row: row[:2]):
+            yield json.dumps({
+                'id': question_id,
+                'question_text': question_text,
+                'choices': [
+                    {'id': choice_id, 'choice_text': choice_text, 'votes': votes}
+                    for _, _, choice_id, choice_text, votes in choices
+                ],
+            }) + '\n'
+    return StreamingHttpResponse(questions(), content_type='application/x-ndjson')
+
+def sse_event(event, data):
+    return 'event: {}\ndata: {}\n\n'.format(event, json.dumps(data))
+
+def results_stream(request, pk):
+    """
+    Server-Sent Events stream of question's tallies
+    First event has all choices, next ones only choices whose votes changed
+    """
+    options = live_results_settings()
+    if not options['ENABLED']:
+        raise Http404("Live results are turned off")
+    question = get_object_or_404(Question, pk=pk, choice_count__gt=0)
+    results_hub = get_results_hub()
+    updates = results_hub.subscribe(question.pk)
+    initial = fetch_tallies([question.pk])[question.pk]
+    #don't hold database connection while stream waits for votes
+    #(it would only be closed when stream ends)
+    if not connection.in_atomic_block:
+        connection.close()
+
+    def events():
+        try:
+            #browser reconnects after stream ends, tell it to do it right away
+            yield 'retry: 1000\n\n'
+            yield sse_event('tallies', initial)
+            deadline = time.monotonic() + options['MAX_DURATION']
+            while time.monotonic() < deadline:
+                try:
+                    changes = updates.get(timeout=options['KEEPALIVE'])
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                else:
+                    yield sse_event('tallies', changes)
+        finally:
+            results_hub.unsubscribe(question.pk, updates)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    #don't let nginx buffer events
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def search(request):
+    """
+    Ranked full-text search of published questions and comments (?q=)
+    Served by search indexes, see polls.search
+    """
+    query = request.GET.get('q', '').strip()
+    limit = settings.POLLS_SEARCH_LIMIT
+    return render(request, 'polls/search.html', {
+        'query': query,
+        'questions': search_questions(query, limit),
+        'comments': search_comments(query, limit),
+    })
+
+def comment_dedup_key(request):
+    return hashlib.md5(request.POST.get('comment_text', '').encode()).hexdigest()
+
+def vote_dedup_key(request):
+    """
+    One vote per question within dedup window, whatever the choice
+    Form sent without choice isn't remembered, so voter can fix it right away
+    """
+    if request.POST.get('choice', '').isdigit():
+        return 'vote'
+
+#throttled before any query, see polls.throttle
+@throttled('comment', 'polls:comments', dedup_key=comment_dedup_key)
 def leave_comment(request, question_id):
-    question = get_object_or_404(Question, pk=question_id)
+    """
+    Saves comment right away or, with comment queue enabled, answers
+    202 once comment is queued (see polls.comments)
+    """
+    comment_queue = get_comment_queue()
+    if comment_queue is None:
+        question = get_object_or_404(Question, pk=question_id)
+    elif Question.objects.filter(pk=question_id).exists():
+        question = None
+    else:
+        raise Http404("No question found matching the query")
     #get comment_text and is comment positive from post request
     #with kwarg(keyword arg) comment_text
+    #NOTE: radio buttons send 'True'/'False' strings, any non empty string
+    #would be truthy for comment counters
     comment = Comment(
-            question=question,
+            question_id=question_id,
             comment_text=request.POST['comment_text'],
-            positive=request.POST['is_positive']
+            positive=request.POST['is_positive'] == 'True'
         )
-    comment.save()
-    return HttpResponseRedirect(reverse('polls:comments', args=(question_id,)))
+    if question is not None:
+        comment.question = question
+        #comment and question counters (see polls.signals) are saved together
+        with transaction.atomic():
+            comment.save()
+        return HttpResponseRedirect(reverse('polls:comments', args=(question_id,)))
+    #bulk INSERT doesn't validate, so queued comment is checked here
+    try:
+        comment.full_clean(exclude=['question'])
+    except ValidationError as error:
+        return HttpResponseBadRequest('; '.join(error.messages))
+    if not comment_queue.put(comment, timeout=comment_queue_settings()['PUT_TIMEOUT']):
+        #worker can't keep up, tell client to come back later
+        response = HttpResponse("Too many comments, try again later", status=503)
+        response['Retry-After'] = 1
+        return response
+    return render(request, 'polls/comment_queued.html', {'question_id': question_id}, status=202)
 
+@throttled('vote', 'polls:results', dedup_key=vote_dedup_key)
 def vote(request, question_id):
-    #get question or 404 
-    #if there is no question with this PK
-    question = get_object_or_404(Question, pk=question_id)
     try:
-        #get selected string choice by PK from post request
+        #get selected choice PK from post request
         #with kwarg(keyword arg) choice
-        selected_choice = question.choice_set.get(pk=request.POST['choice'])
-    except (KeyError, Choice.DoesNotExist):
-        #if there is no choice with this PK
-        #return to detail page with error message
-        return render(request, 'polls/detail.html', {
-            'question':question,
-            'error_message': "You didn't select a choice",
-        })
-    else:
-        #if everything is fine add vote and save choice
-
-        #NOTE: F objects fall silently if attribute is wrong
-        #example: selected_choice.vote_ = F('votes') + 1
-        selected_choice.votes = F('votes') + 1
-        selected_choice.save()
+        choice_id = int(request.POST['choice'])
+    except (KeyError, ValueError):
+        choice_id = None
+    #add vote (written right away or through vote buffer, see polls.votes)
+    #question is only loaded if vote didn't go through
+    if choice_id is not None and record_vote(question_id, choice_id):
+        notify_results_changed(question_id)
         # "Always return an HttpResponseRedirect after successfully dealing
         # with POST data. This prevents data from being posted twice if a
         # user hits the Back button." by docs.djangoproject.com
-        return HttpResponseRedirect(reverse('polls:results', args=(question.id,)))
\ No newline at end of file
+        return HttpResponseRedirect(reverse('polls:results', args=(question_id,)))
+    #get question or 404
+    #if there is no question with this PK
+    question = get_object_or_404(Question, pk=question_id)
+    #if there is no choice with this PK
+    #return to detail page with error message
+    return render(request, 'polls/detail.html', {
+        'question':question,
+        'choices': question.choice_set.all(),
+        'error_message': "You didn't select a choice",
+    })
\ No newline at end of file
@@ -0,0 +1,225 @@
+"""
+Vote recording
+
+By default every vote is an UPDATE of choice row (and question counter).
+With POLLS_VOTE_BUFFER['ENABLED'] votes are accumulated in process memory
+and written by background thread as one UPDATE ... CASE per batch, so hot
+choices don't serialize every request on their row lock.
+Without buffer, POLLS_VOTE_SHARDS['ENABLED'] spreads votes of every choice
+over several counter rows (see polls.shards).
+"""
+import atexit
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .expressions import sum_case
+from .history import record_events
+from .models import Question, Choice
+from .shards import sharded_votes, vote_shards_settings, write_sharded_vote
+
+VOTE_BUFFER_DEFAULTS = {
+    'ENABLED': False,
+    #seconds between background flushes
+    'FLUSH_INTERVAL': 1.0,
+    #amount of pending votes that wakes flusher thread right away
+    'FLUSH_SIZE': 500,
+    #merge pending votes into results page
+    'READ_YOUR_WRITES': True,
+}
+
+def vote_buffer_settings():
+    return {**VOTE_BUFFER_DEFAULTS, **getattr(settings, 'POLLS_VOTE_BUFFER', {})}
+
+def apply_votes(votes):
+    """
+    Adds votes to database
+    votes is {(question_id, choice_id): amount}, all choices are updated
+    by one statement, all questions by another and vote events are
+    appended by a third one
+    """
+    choice_deltas = Counter()
+    question_deltas = Counter()
+    for (question_id, choice_id), amount in votes.items():
+        choice_deltas[choice_id] += amount
+        question_deltas[question_id] += amount
+    with transaction.atomic():
+        Choice.objects.filter(pk__in=choice_deltas).update(
+            votes=F('votes') + sum_case(choice_deltas))
+        Question.objects.filter(pk__in=question_deltas).update(
+            total_votes=F('total_votes') + sum_case(question_deltas),
+            modified=timezone.now(),
+            version=F('version') + 1)
+        record_events(votes)
+
+def record_vote(question_id, choice_id):
+    """
+    Adds single vote, buffered if vote buffer is enabled
+    Returns False if question has no such choice
+    """
+    vote_buffer = get_vote_buffer()
+    if vote_buffer is None:
+        if vote_shards_settings()['ENABLED']:
+            return write_sharded_vote(question_id, choice_id)
+        return write_vote(question_id, choice_id)
+    if not Choice.objects.filter(pk=choice_id, question_id=question_id).exists():
+        return False
+    vote_buffer.add(question_id, choice_id)
+    return True
+
+def write_vote(question_id, choice_id):
+    """
+    Adds single vote to database right away
+    Choice update doubles as check that choice belongs to question,
+    so vote takes two UPDATEs, history INSERT and no reads.
+    Returns False if question has no such choice
+    """
+    #choice votes and question counter are saved together
+    #NOTE: F objects fall silently if attribute is wrong
+    #example: selected_choice.vote_ = F('votes') + 1
+    with transaction.atomic():
+        updated = (Choice.objects
+                   .filter(pk=choice_id, question_id=question_id)
+                   .update(votes=F('votes') + 1))
+        if updated:
+            Question.objects.filter(pk=question_id).update(
+                total_votes=F('total_votes') + 1,
+                modified=timezone.now(),
+                version=F('version') + 1)
+            record_events({(question_id, choice_id): 1})
+    return bool(updated)
+
+def pending_votes(question_id, version=None):
+    """
+    Returns {choice_id: amount} of votes for question that are not in choice votes yet:
+    votes in vote buffer (unless read-your-writes is turned off)
+    and in shards of sharded counters
+    Shard sums are cached under question's version if it is given
+    """
+    pending = Counter()
+    if vote_shards_settings()['ENABLED']:
+        pending.update(sharded_votes(question_id, version))
+    vote_buffer = get_vote_buffer()
+    if vote_buffer is not None and vote_buffer_settings()['READ_YOUR_WRITES']:
+        pending.update(vote_buffer.pending(question_id))
+    return dict(pending)
+
+class VoteBuffer:
+    """
+    Process-local vote counter with periodic batched flush
+
+    Votes go to _pending. Flush moves them to _inflight while they are being
+    written, so pending() still sees them until transaction commits.
+    Full buffer wakes flusher thread, voter's request never writes the batch.
+    """
+    def __init__(self, flush_interval=1.0, flush_size=500, apply=apply_votes):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._apply = apply
+        self._lock = threading.Lock()
+        #only one flush at a time, otherwise _inflight would be overwritten
+        self._flush_lock = threading.Lock()
+        self._pending = Counter()
+        self._pending_size = 0
+        self._inflight = Counter()
+        self._stopped = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def add(self, question_id, choice_id, amount=1):
+        with self._lock:
+            self._pending[(question_id, choice_id)] += amount
+            self._pending_size += amount
+            full = self._pending_size >= self.flush_size
+        if full:
+            self._wakeup.set()
+
+    def pending(self, question_id):
+        """Returns {choice_id: amount} of not yet written votes for question"""
+        result = Counter()
+        with self._lock:
+            for votes in (self._inflight, self._pending):
+                for (vote_question_id, choice_id), amount in votes.items():
+                    if vote_question_id == question_id:
+                        result[choice_id] += amount
+        return dict(result)
+
+    def flush(self):
+        """Writes pending votes to database, returns amount of written votes"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, Counter()
+                self._pending_size = 0
+                self._inflight = batch
+            if not batch:
+                return 0
+            try:
+                self._apply(batch)
+            except Exception:
+                #put votes back so they are retried by next flush
+                with self._lock:
+                    self._pending.update(batch)
+                    self._pending_size += sum(batch.values())
+                raise
+            finally:
+                with self._lock:
+                    self._inflight = Counter()
+            return sum(batch.values())
+
+    def start(self):
+        """Starts background flusher thread"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='vote-buffer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops flusher thread and writes what is left"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        try:
+            while True:
+                #woken by full buffer or stop(), otherwise every flush_interval
+                self._wakeup.wait(self.flush_interval)
+                self._wakeup.clear()
+                if self._stopped.is_set():
+                    break
+                close_old_connections()
+                try:
+                    self.flush()
+                except Exception:
+                    #votes are kept for next try, connection may be broken
+                    connection.close()
+        finally:
+            connection.close()
+
+_vote_buffer = None
+_vote_buffer_lock = threading.Lock()
+
+def get_vote_buffer():
+    """
+    Returns process-wide VoteBuffer with started flusher or None if disabled
+    Buffer is flushed on interpreter shutdown
+    """
+    global _vote_buffer
+    options = vote_buffer_settings()
+    if not options['ENABLED']:
+        return None
+    if _vote_buffer is None:
+        with _vote_buffer_lock:
+            if _vote_buffer is None:
+                vote_buffer = VoteBuffer(options['FLUSH_INTERVAL'], options['FLUSH_SIZE'])
+                vote_buffer.start()
+                atexit.register(vote_buffer.stop)
+                _vote_buffer = vote_buffer
+    return _vote_buffer